@@ -0,0 +1,55 @@
+"""Import-time benchmark for the app's modules.
+
+Each import is timed in a fresh interpreter, so the numbers are true cold
+costs (including everything the module pulls in). Run from the repo root:
+
+    python bench_imports.py            # 5 runs per module
+    python bench_imports.py -n 10 plotly.express
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+
+MODULES = [
+    "streamlit",
+    "pandas",
+    "config",
+    "sql_helpers",
+    "llm_helpers",
+    "ui_components",
+    "jobs",
+    # Deferred until a chart or graph view is opened
+    "plotly.graph_objects",
+    "plotly.express",
+]
+
+CHILD = "import time; t0 = time.perf_counter(); import {mod}; print(time.perf_counter() - t0)"
+
+def time_import(module: str, runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", CHILD.format(mod=module)],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(out.stderr.strip().splitlines()[-1])
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<24}{'median ms':>12}{'min ms':>10}")
+    for mod in args.modules:
+        try:
+            times = time_import(mod, args.runs)
+        except RuntimeError as e:
+            print(f"{mod:<24}{'error':>12}  {e}")
+            continue
+        print(f"{mod:<24}{statistics.median(times) * 1000:>12.1f}{min(times) * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
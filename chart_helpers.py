@@ -0,0 +1,110 @@
+import re
+import numpy as np
+import pandas as pd
+from sql_helpers import run_sql_query
+from scheduler import sql_scheduler, LANE_NORMAL
+
+# Aggregations behind the "Quick Charts" view. Every function returns small
+# summary frames (bins, quantiles, group totals) so Plotly never receives the
+# raw rows — either computed with NumPy on the fetched frame or pushed down
+# to MySQL as an aggregate query over the generated SELECT. Pushdown queries
+# scan the full table, so they queue on the shared SQL scheduler like any
+# other query.
+
+AGG_FUNCS = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
+DEFAULT_BINS = 30
+MAX_GROUPS = 50
+
+_TRAILING_LIMIT = re.compile(r"\s+LIMIT\s+\d+(\s*(,|OFFSET)\s*\d+)?\s*;?\s*$", re.IGNORECASE)
+
+# ── NumPy (fetched rows) ───────────────────────────────────────────────────────
+def histogram_local(series: pd.Series, bins: int = DEFAULT_BINS) -> pd.DataFrame:
+    """Return {bin_start, bin_end, count} for a numeric series."""
+    values = pd.to_numeric(series, errors="coerce").dropna().to_numpy(dtype=float)
+    if values.size == 0:
+        return pd.DataFrame(columns=["bin_start", "bin_end", "count"])
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts})
+
+def quantiles_local(series: pd.Series) -> dict:
+    """Return min/q1/median/q3/max/count for a numeric series."""
+    values = pd.to_numeric(series, errors="coerce").dropna().to_numpy(dtype=float)
+    if values.size == 0:
+        return {}
+    q = np.quantile(values, [0.0, 0.25, 0.5, 0.75, 1.0])
+    return {"min": q[0], "q1": q[1], "median": q[2], "q3": q[3], "max": q[4],
+            "count": int(values.size)}
+
+def group_agg_local(df: pd.DataFrame, group_col: str, value_col: str,
+                    agg: str = "COUNT", limit: int = MAX_GROUPS) -> pd.DataFrame:
+    """Return {group_col, value} aggregated on the fetched frame, top `limit` groups."""
+    grouped = df.groupby(group_col, dropna=False)[value_col]
+    func = {"COUNT": "count", "SUM": "sum", "AVG": "mean", "MIN": "min", "MAX": "max"}[agg]
+    out = grouped.agg(func).rename("value").reset_index()
+    return out.sort_values("value", ascending=False).head(limit)
+
+# ── SQL Pushdown (full table) ──────────────────────────────────────────────────
+def strip_limit(sql: str) -> str:
+    """Drop a trailing LIMIT so pushdown aggregates cover every matching row."""
+    return _TRAILING_LIMIT.sub("", sql.strip().rstrip(";"))
+
+def _run(sql: str, db_name: str, user_id: str) -> pd.DataFrame:
+    with sql_scheduler.slot(user_id, LANE_NORMAL):
+        df, _, _ = run_sql_query(sql, db_name)
+    return df
+
+def _q(col: str) -> str:
+    return "`" + col.replace("`", "``") + "`"
+
+def histogram_sql(sql: str, col: str, db_name: str, bins: int = DEFAULT_BINS,
+                  user_id: str = "anonymous") -> pd.DataFrame:
+    """Bin `col` over the full result of `sql` inside MySQL."""
+    base, c = strip_limit(sql), _q(col)
+    bounds = _run(f"SELECT MIN({c}) AS lo, MAX({c}) AS hi FROM ({base}) AS q", db_name, user_id)
+    lo, hi = bounds.iloc[0]["lo"], bounds.iloc[0]["hi"]
+    if pd.isna(lo) or pd.isna(hi):
+        return pd.DataFrame(columns=["bin_start", "bin_end", "count"])
+    lo, hi = float(lo), float(hi)
+    if hi == lo:
+        lo, hi = lo - 0.5, hi + 0.5          # same range np.histogram uses for one value
+    width = (hi - lo) / bins
+    binned = _run(
+        f"SELECT LEAST(FLOOR(({c} - {lo!r}) / {width!r}), {bins - 1}) AS b, COUNT(*) AS n "
+        f"FROM ({base}) AS q WHERE {c} IS NOT NULL GROUP BY b ORDER BY b",
+        db_name, user_id)
+    counts = np.zeros(bins, dtype=np.int64)
+    for b, n in zip(binned["b"], binned["n"]):
+        counts[int(b)] = int(n)
+    edges = lo + width * np.arange(bins + 1)
+    return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts})
+
+def quantiles_sql(sql: str, col: str, db_name: str, user_id: str = "anonymous") -> dict:
+    """Nearest-rank quartiles of `col` over the full result of `sql` (MySQL 8 window functions)."""
+    base, c = strip_limit(sql), _q(col)
+    picks = ", ".join(
+        f"MAX(CASE WHEN rn = GREATEST(1, CEIL(n * {p})) THEN v END) AS {name}"
+        for name, p in [("q1", 0.25), ("median", 0.5), ("q3", 0.75)]
+    )
+    df = _run(
+        f"SELECT MIN(v) AS min, {picks}, MAX(v) AS max, MAX(n) AS count FROM ("
+        f"SELECT {c} AS v, ROW_NUMBER() OVER (ORDER BY {c}) AS rn, COUNT(*) OVER () AS n "
+        f"FROM ({base}) AS q WHERE {c} IS NOT NULL) AS ranked",
+        db_name, user_id)
+    row = df.iloc[0]
+    if pd.isna(row["count"]):
+        return {}
+    return {k: (int(row[k]) if k == "count" else float(row[k]))
+            for k in ["min", "q1", "median", "q3", "max", "count"]}
+
+def group_agg_sql(sql: str, group_col: str, value_col: str, db_name: str,
+                  agg: str = "COUNT", limit: int = MAX_GROUPS,
+                  user_id: str = "anonymous") -> pd.DataFrame:
+    """Aggregate `value_col` by `group_col` over the full result of `sql` inside MySQL."""
+    if agg not in AGG_FUNCS:
+        raise Exception(f"Unsupported aggregate: {agg}")
+    base, g, v = strip_limit(sql), _q(group_col), _q(value_col)
+    df = _run(
+        f"SELECT {g}, {agg}({v}) AS value FROM ({base}) AS q "
+        f"GROUP BY {g} ORDER BY value DESC LIMIT {int(limit)}",
+        db_name, user_id)
+    return df
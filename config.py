@@ -8,6 +8,8 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
 OLLAMA_ENDPOINT = "http://localhost:11434/api/chat"
+# How long Ollama keeps the model (and its prompt KV-cache) loaded after a call
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
 # ─── Available Models ───────────────────────────────────────────────────────
 GROQ_MODELS = [
@@ -26,10 +28,71 @@ OLLAMA_MODELS = [
     "gemma2"
 ]
 
+# GGUF files (quantized) served in-process through llama.cpp by the "Local" provider
+LOCAL_MODEL_DIR = os.getenv("LOCAL_MODEL_DIR", "models")
+LOCAL_MODELS = [m.strip() for m in os.getenv(
+    "LOCAL_MODELS", "qwen2.5-coder-1.5b-instruct-q4_k_m.gguf").split(",") if m.strip()]
+LOCAL_N_CTX = int(os.getenv("LOCAL_N_CTX", "8192"))
+LOCAL_N_THREADS = int(os.getenv("LOCAL_N_THREADS", str(os.cpu_count() or 4)))
+
+# Automatic repair of generated SQL that fails validation, EXPLAIN or execution
+MAX_REPAIR_ATTEMPTS = int(os.getenv("MAX_REPAIR_ATTEMPTS", "2"))
+
 # ─── MySQL ──────────────────────────────────────────────────────────────────
 MYSQL_HOST = os.getenv("MYSQL_HOST")
 MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASS = os.getenv("MYSQL_PASS")
 
+# Optional execution targets besides the primary: read replicas ("host" or
+# "host:port", comma-separated) and a dedicated analytics copy for heavy queries
+MYSQL_REPLICAS = [h.strip() for h in os.getenv("MYSQL_REPLICAS", "").split(",") if h.strip()]
+MYSQL_ANALYTICS_HOST = os.getenv("MYSQL_ANALYTICS_HOST")
+MAX_REPLICA_LAG_S = int(os.getenv("MAX_REPLICA_LAG_S", "30"))
+HEAVY_QUERY_ROWS = int(os.getenv("HEAVY_QUERY_ROWS", "1000000"))
+HEALTH_CHECK_INTERVAL_S = int(os.getenv("HEALTH_CHECK_INTERVAL_S", "15"))
+
+# Optional local DuckDB acceleration. Entries are "db.table:watermark[:pk]";
+# the watermark is an updated-at or auto-increment column used for incremental
+# refresh, and pk (if given) lets updated rows replace their old version.
+ACCEL_TABLES = [t.strip() for t in os.getenv("ACCEL_TABLES", "").split(",") if t.strip()]
+ACCEL_DIR = os.getenv("ACCEL_DIR", ".accel")
+ACCEL_REFRESH_S = int(os.getenv("ACCEL_REFRESH_S", "300"))
+ACCEL_RECONCILE_S = int(os.getenv("ACCEL_RECONCILE_S", "3600"))
+
+# Column value profiles (cardinality, min/max, top values) used as prompt hints
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".profiles")
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "5000"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "10"))
+PROFILE_MAX_AGE_S = int(os.getenv("PROFILE_MAX_AGE_S", "86400"))
+
 # ─── Databases to expose in UI ─────────────────────────────────────────────
-DATABASES = os.getenv("ALLOWED_DATABASES", "").split(",")
+DATABASES = [d.strip() for d in os.getenv("ALLOWED_DATABASES", "").split(",") if d.strip()]
+
+# Worker threads used to preload every allowed database's schema in the background
+SCHEMA_PRELOAD_WORKERS = int(os.getenv("SCHEMA_PRELOAD_WORKERS", "4"))
+
+# Seconds between information_schema checksum polls for schema changes
+SCHEMA_POLL_S = int(os.getenv("SCHEMA_POLL_S", "30"))
+
+# ─── Shared Scheduling (all sessions of one server process) ─────────────────
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_PER_USER = int(os.getenv("LLM_MAX_PER_USER", "1"))
+SQL_MAX_CONCURRENCY = int(os.getenv("SQL_MAX_CONCURRENCY", "8"))
+SQL_MAX_PER_USER = int(os.getenv("SQL_MAX_PER_USER", "2"))
+
+# Requests per minute allowed per provider (0 = unlimited)
+PROVIDER_RPM = {
+    "Groq": int(os.getenv("GROQ_RPM", "30")),
+    "Ollama": int(os.getenv("OLLAMA_RPM", "0")),
+    "Local": int(os.getenv("LOCAL_RPM", "0")),
+}
+
+# Background query jobs: worker threads, where results are spilled, how long they are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_DIR = os.getenv("JOB_DIR", ".jobs")
+JOB_RETENTION_S = int(os.getenv("JOB_RETENTION_S", "86400"))
+# Signs the ?uid= link that lets a reopened tab find its jobs (generated into JOB_DIR if unset)
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+
+# Queries whose EXPLAIN row estimate stays under this go to the fast lane
+CHEAP_QUERY_ROWS = int(os.getenv("CHEAP_QUERY_ROWS", "10000"))
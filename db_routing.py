@@ -0,0 +1,131 @@
+import time
+import threading
+import mysql.connector
+from config import (
+    MYSQL_HOST, MYSQL_USER, MYSQL_PASS, MYSQL_REPLICAS, MYSQL_ANALYTICS_HOST,
+    MAX_REPLICA_LAG_S, HEAVY_QUERY_ROWS, HEALTH_CHECK_INTERVAL_S
+)
+
+# Execution targets: the primary from MYSQL_HOST plus optional read replicas
+# and an analytics copy. A daemon thread health-checks every non-primary
+# target and tracks replication lag; routing only picks healthy targets
+# within MAX_REPLICA_LAG_S and always keeps the primary as the last resort.
+
+# Connection-level failures worth failing over on (bad SQL is not one of them)
+FAILOVER_ERRORS = (mysql.connector.errors.InterfaceError,
+                   mysql.connector.errors.OperationalError)
+
+# ── Targets ────────────────────────────────────────────────────────────────────
+class ExecTarget:
+    """One MySQL server queries can run on."""
+
+    def __init__(self, name: str, role: str, host: str):
+        host, _, port = (host or "").partition(":")
+        self.name = name
+        self.role = role                  # "primary" | "replica" | "analytics"
+        self.host = host
+        self.port = int(port or 3306)
+        # Secondaries stay out of rotation until their first health check
+        self.healthy = role == "primary"
+        self.lag_s = None                 # seconds behind source, None if unknown
+        self.replicating = False          # has a SHOW REPLICA STATUS row
+        self.checked_at = 0.0
+
+    def connect(self, db_name: str | None = None, timeout: int | None = None):
+        kwargs = {"connection_timeout": timeout} if timeout else {}
+        return mysql.connector.connect(
+            host=self.host, port=self.port, user=MYSQL_USER,
+            password=MYSQL_PASS, database=db_name, **kwargs
+        )
+
+    def __repr__(self):
+        return f"ExecTarget({self.name}, {self.role}, healthy={self.healthy}, lag={self.lag_s})"
+
+PRIMARY = ExecTarget("primary", "primary", MYSQL_HOST)
+REPLICAS = [ExecTarget(f"replica-{i + 1}", "replica", h) for i, h in enumerate(MYSQL_REPLICAS)]
+ANALYTICS = ExecTarget("analytics", "analytics", MYSQL_ANALYTICS_HOST) if MYSQL_ANALYTICS_HOST else None
+
+def all_targets() -> list:
+    return [PRIMARY] + REPLICAS + ([ANALYTICS] if ANALYTICS else [])
+
+def has_secondaries() -> bool:
+    return bool(REPLICAS or ANALYTICS)
+
+# ── Health Checks ──────────────────────────────────────────────────────────────
+def check_target(target: ExecTarget):
+    """Probe `target` and refresh its health and replication lag."""
+    try:
+        cnx = target.connect(timeout=3)
+        cur = cnx.cursor(dictionary=True)
+        try:
+            lag, replicating = None, False
+            if target.role != "primary":
+                try:
+                    cur.execute("SHOW REPLICA STATUS")
+                except mysql.connector.Error:
+                    cur.execute("SHOW SLAVE STATUS")       # MySQL < 8.0.22
+                row = cur.fetchone()
+                if row:
+                    # NULL lag on a replica means replication is stopped or broken
+                    replicating = True
+                    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+            else:
+                cur.execute("SELECT 1")
+                cur.fetchall()
+        finally:
+            cur.close(); cnx.close()
+        target.lag_s = lag
+        target.replicating = replicating
+        target.healthy = True
+    except Exception as e:
+        print(f"⚠️  Health check for {target.name} ({target.host}) failed: {e}")
+        target.healthy = False
+    target.checked_at = time.time()
+
+def mark_down(target: ExecTarget):
+    """Take a target out of rotation until the next successful health check."""
+    target.healthy = False
+    target.checked_at = time.time()
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def _monitor_loop():
+    while True:
+        for target in all_targets():
+            if target.role != "primary":
+                check_target(target)
+        time.sleep(HEALTH_CHECK_INTERVAL_S)
+
+def ensure_monitor():
+    """Start the background health checker once per process (only if there are secondaries)."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None and has_secondaries():
+            _monitor = threading.Thread(target=_monitor_loop, name="db-health", daemon=True)
+            _monitor.start()
+
+# ── Routing ────────────────────────────────────────────────────────────────────
+def _usable(target: ExecTarget) -> bool:
+    """Healthy and within MAX_REPLICA_LAG_S; unknown lag is only fine for non-replicas."""
+    if not target.healthy:
+        return False
+    if target.lag_s is None:
+        return not target.replicating
+    return target.lag_s <= MAX_REPLICA_LAG_S
+
+def plan_targets(est_rows: int | None) -> list:
+    """Targets to try, in order, for a query expected to examine `est_rows` rows.
+
+    Heavy queries prefer the analytics copy, then replicas; everything else
+    prefers the least-lagged replica. The primary is always the fallback.
+    """
+    ensure_monitor()
+    replicas = sorted((r for r in REPLICAS if _usable(r)),
+                      key=lambda r: (r.lag_s is None, r.lag_s or 0))
+    plan = []
+    if est_rows is not None and est_rows >= HEAVY_QUERY_ROWS and ANALYTICS and _usable(ANALYTICS):
+        plan.append(ANALYTICS)
+    plan += replicas
+    plan.append(PRIMARY)
+    return plan
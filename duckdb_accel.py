@@ -0,0 +1,254 @@
+import os
+import time
+import datetime
+import threading
+import pandas as pd
+from config import ACCEL_TABLES, ACCEL_DIR, ACCEL_REFRESH_S, ACCEL_RECONCILE_S
+from db_routing import plan_targets
+
+# Local columnar acceleration: tables listed in ACCEL_TABLES are snapshotted
+# into one DuckDB file per MySQL database and refreshed incrementally by
+# watermark. A generated MySQL SELECT is transpiled with sqlglot and served
+# locally only when every table it touches has a snapshot; anything else
+# (or any failure) falls back to MySQL. duckdb and sqlglot are optional.
+#
+# With a pk, changed rows are re-read and replaced (upsert). Without one the
+# snapshot is insert-only: only use that for append-only watermarks (an
+# auto-increment id, a creation timestamp), otherwise every update of a row
+# would append another copy of it.
+#
+# Keeping answers close to MySQL's:
+# - strings compare case-insensitively (nocase), like the default _ci collations;
+# - a snapshot not refreshed for STALE_REFRESHES intervals is no longer served;
+# - every ACCEL_RECONCILE_S deletes are detected: with a pk by anti-joining
+#   MySQL's keys, without one by row count (a larger local copy is rebuilt).
+# Still different: accent-insensitive (_ai) and PAD SPACE comparisons, deletes
+# in a pk-less table offset by as many inserts, and up to one refresh
+# interval of lag.
+
+CHUNK_ROWS = 50_000
+STALE_REFRESHES = 3
+
+# ── Snapshot Specs ─────────────────────────────────────────────────────────────
+def _parse_spec(spec: str) -> dict:
+    name, _, rest = spec.partition(":")
+    db, _, table = name.partition(".")
+    watermark, _, pk = rest.partition(":")
+    if not (db and table and watermark):
+        raise Exception(f"Bad ACCEL_TABLES entry '{spec}', expected db.table:watermark[:pk]")
+    return {"db": db, "table": table, "watermark": watermark, "pk": pk or None}
+
+SPECS = [_parse_spec(s) for s in ACCEL_TABLES]
+
+_connections = {}
+_locks = {}
+_ready = {}                       # (db, table) -> epoch of its last completed refresh
+_stats = {"local": 0, "fallback": 0, "rows_synced": 0, "rows_deleted": 0,
+          "last_refresh": None, "last_reconcile": None}
+_state_lock = threading.Lock()
+
+def enabled() -> bool:
+    return bool(SPECS)
+
+def _connection(db_name: str):
+    """Process-wide DuckDB connection for one MySQL database's snapshots."""
+    import duckdb
+    with _state_lock:
+        if db_name not in _connections:
+            os.makedirs(ACCEL_DIR, exist_ok=True)
+            con = duckdb.connect(os.path.join(ACCEL_DIR, f"{db_name}.duckdb"),
+                                 config={"default_collation": "nocase"})
+            con.execute("CREATE TABLE IF NOT EXISTS _accel_meta ("
+                        "table_name VARCHAR PRIMARY KEY, watermark VARCHAR, refreshed_at TIMESTAMP)")
+            wanted = {s["table"] for s in SPECS if s["db"] == db_name}
+            for table, refreshed_at in con.execute(
+                    "SELECT table_name, refreshed_at FROM _accel_meta").fetchall():
+                if table in wanted:
+                    _ready[(db_name, table)] = refreshed_at.timestamp() if refreshed_at else 0.0
+            _connections[db_name] = con
+            _locks[db_name] = threading.Lock()
+        return _connections[db_name], _locks[db_name]
+
+# ── Incremental Refresh ────────────────────────────────────────────────────────
+def refresh_table(db: str, table: str, watermark: str, pk: str | None = None) -> int:
+    """Pull rows past the stored watermark from MySQL into DuckDB. Returns rows synced.
+
+    The whole refresh is one DuckDB transaction, so concurrent readers never
+    see a half-applied chunk. Without `pk` rows are only ever appended.
+    """
+    con, lock = _connection(db)
+    with lock:
+        row = con.execute("SELECT watermark FROM _accel_meta WHERE table_name = ?",
+                          [table]).fetchone()
+        last = row[0] if row else None
+        exists = last is not None
+
+        # With a pk, re-read the boundary value too: rows sharing the last
+        # watermark may have arrived after the previous refresh.
+        op = ">=" if pk else ">"
+        sql = f"SELECT * FROM `{table}`"
+        params = ()
+        if last is not None:
+            sql += f" WHERE `{watermark}` {op} %s"
+            params = (last,)
+        sql += f" ORDER BY `{watermark}`"
+
+        cnx = plan_targets(None)[0].connect(db)
+        cur = cnx.cursor()
+        synced, new_mark = 0, last
+        con.execute("BEGIN TRANSACTION")
+        try:
+            if not exists:
+                con.execute(f'DROP TABLE IF EXISTS "{table}"')  # leftover of an interrupted load
+            cur.execute(sql, params)
+            cols = [c[0] for c in cur.description]
+            while True:
+                rows = cur.fetchmany(CHUNK_ROWS)
+                if not rows:
+                    break
+                chunk = pd.DataFrame(rows, columns=cols)
+                con.register("chunk", chunk)
+                if not exists:
+                    con.execute(f'CREATE TABLE "{table}" AS SELECT * FROM chunk')
+                    exists = True
+                else:
+                    if pk:
+                        con.execute(f'DELETE FROM "{table}" WHERE "{pk}" IN (SELECT "{pk}" FROM chunk)')
+                    con.execute(f'INSERT INTO "{table}" SELECT * FROM chunk')
+                con.unregister("chunk")
+                synced += len(chunk)
+                new_mark = str(chunk[watermark].max())
+            refreshed_at = datetime.datetime.now()
+            if exists:
+                con.execute("INSERT OR REPLACE INTO _accel_meta VALUES (?, ?, ?)",
+                            [table, new_mark, refreshed_at])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            cur.close(); cnx.close()
+
+        if exists:
+            _ready[(db, table)] = refreshed_at.timestamp()
+    return synced
+
+def reconcile_table(db: str, table: str, pk: str | None = None) -> int:
+    """Remove local rows deleted in MySQL. Returns the number of rows dropped.
+
+    With `pk` the snapshot keeps only keys still present in MySQL. Without
+    one, a local copy larger than the MySQL table is dropped and rebuilt
+    from scratch by the next refresh.
+    """
+    con, lock = _connection(db)
+    cnx = plan_targets(None)[0].connect(db)
+    cur = cnx.cursor()
+    with lock:
+        try:
+            if (db, table) not in _ready:
+                return 0
+            local = con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            if not pk:
+                cur.execute(f"SELECT COUNT(*) FROM `{table}`")
+                remote = cur.fetchone()[0]
+                if local <= remote:
+                    return 0
+                con.execute("BEGIN TRANSACTION")
+                try:
+                    con.execute("DELETE FROM _accel_meta WHERE table_name = ?", [table])
+                    con.execute(f'DROP TABLE IF EXISTS "{table}"')
+                    con.execute("COMMIT")
+                except Exception:
+                    con.execute("ROLLBACK")
+                    raise
+                _ready.pop((db, table), None)
+                return local - remote
+
+            cur.execute(f"SELECT `{pk}` FROM `{table}`")
+            keys = pd.DataFrame(cur.fetchall(), columns=[pk])
+            con.register("remote_keys", keys)
+            con.execute("BEGIN TRANSACTION")
+            try:
+                con.execute(f'DELETE FROM "{table}" WHERE "{pk}" NOT IN (SELECT "{pk}" FROM remote_keys)')
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            finally:
+                con.unregister("remote_keys")
+            return local - con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        finally:
+            cur.close(); cnx.close()
+
+def refresh_all(reconcile: bool = False):
+    for spec in SPECS:
+        try:
+            n = refresh_table(spec["db"], spec["table"], spec["watermark"], spec["pk"])
+            _stats["rows_synced"] += n
+            if reconcile:
+                _stats["rows_deleted"] += reconcile_table(spec["db"], spec["table"], spec["pk"])
+        except Exception as e:
+            print(f"⚠️  Snapshot refresh of {spec['db']}.{spec['table']} failed: {e}")
+    _stats["last_refresh"] = time.time()
+    if reconcile:
+        _stats["last_reconcile"] = _stats["last_refresh"]
+
+_refresher = None
+
+def ensure_refresher():
+    """Start the background snapshot refresher once per process."""
+    global _refresher
+    with _state_lock:
+        if _refresher is not None or not enabled():
+            return
+        def loop():
+            last_reconcile = 0.0
+            while True:
+                reconcile = time.time() - last_reconcile >= ACCEL_RECONCILE_S
+                refresh_all(reconcile)
+                if reconcile:
+                    last_reconcile = time.time()
+                time.sleep(ACCEL_REFRESH_S)
+        _refresher = threading.Thread(target=loop, name="accel-refresh", daemon=True)
+        _refresher.start()
+
+# ── Query Serving ──────────────────────────────────────────────────────────────
+def _servable(db_name: str, table: str) -> bool:
+    """Snapshot exists and was refreshed within STALE_REFRESHES intervals."""
+    refreshed = _ready.get((db_name, table))
+    return refreshed is not None and time.time() - refreshed <= STALE_REFRESHES * ACCEL_REFRESH_S
+
+def transpile(sql: str, db_name: str) -> str | None:
+    """MySQL SELECT → DuckDB SQL, or None if it touches a table without a fresh snapshot."""
+    import sqlglot
+    from sqlglot import exp
+
+    tree = sqlglot.parse_one(sql, read="mysql")
+    ctes = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    for tbl in tree.find_all(exp.Table):
+        if tbl.name in ctes and not tbl.db:
+            continue
+        if (tbl.db or db_name) != db_name or not _servable(db_name, tbl.name):
+            return None
+        tbl.set("db", None)
+    return tree.sql(dialect="duckdb")
+
+def try_accelerated(sql: str, db_name: str):
+    """Run `sql` against the local snapshot; None means "use MySQL instead"."""
+    if not any(spec["db"] == db_name for spec in SPECS):
+        return None
+    ensure_refresher()
+    try:
+        con, _ = _connection(db_name)
+        duck_sql = transpile(sql, db_name)
+        if duck_sql is not None:
+            df = con.cursor().execute(duck_sql).df()
+            _stats["local"] += 1
+            return df
+    except Exception as e:
+        print(f"⚠️  Local acceleration skipped: {e}")
+    _stats["fallback"] += 1
+    return None
+
+def get_accel_stats() -> dict:
+    return dict(_stats, tables=sum(_servable(db, t) for db, t in list(_ready)))
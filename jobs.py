@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import uuid
+import hmac
+import hashlib
+import secrets
+import threading
+import pandas as pd
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from mysql.connector.errors import ProgrammingError
+from config import JOB_WORKERS, JOB_DIR, JOB_RETENTION_S, SESSION_SECRET, SQL_MAX_PER_USER
+from sql_helpers import run_sql_query, route_query, estimate_rows
+from llm_helpers import repair_until_valid
+from scheduler import llm_scheduler, sql_scheduler, query_lane
+
+# Background query execution. A submitted job runs on a worker pool, its
+# result frame is spilled to JOB_DIR as a pickle and its metadata as JSON,
+# so a rerun, a closed tab or a server restart doesn't lose finished work.
+# Jobs still queued or running when the process stopped come back as
+# "interrupted". Jobs belong to a server-issued user id; the browser only
+# carries a signed, expiring token for it (see issue_token / resolve_token).
+#
+# Jobs only reach the pool when a worker is free, and waiting jobs are
+# dispatched round-robin across users (at most SQL_MAX_PER_USER workers per
+# user), so one user's backlog can't hold every worker.
+
+ACTIVE = ("queued", "running")
+
+class JobManager:
+    """Process-wide registry of background query jobs."""
+
+    def __init__(self, job_dir: str = JOB_DIR, max_workers: int = JOB_WORKERS,
+                 per_user: int = SQL_MAX_PER_USER):
+        self.job_dir = job_dir
+        self.max_workers = max(1, max_workers)
+        self.per_user = max(1, per_user)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                        thread_name_prefix="query-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = []                # [(job_id, user_id, fn)] waiting for a worker
+        self._busy = defaultdict(int)     # user -> jobs holding a worker
+        os.makedirs(job_dir, exist_ok=True)
+        self._secret = self._load_secret()
+        self._load()
+
+    def _load_secret(self) -> bytes:
+        if SESSION_SECRET:
+            return SESSION_SECRET.encode("utf-8")
+        path = os.path.join(self.job_dir, ".secret")
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            secret = secrets.token_hex(32).encode("ascii")
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(secret)
+            return secret
+
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self._secret, payload.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def issue_token(self, user_id: str) -> str:
+        """Signed handle for `user_id`, valid as long as its jobs are kept."""
+        payload = f"{user_id}.{int(time.time() + JOB_RETENTION_S)}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def resolve_token(self, token: str) -> str | None:
+        """User id behind a token from issue_token(); None if forged or expired."""
+        user_id, _, rest = (token or "").partition(".")
+        expires, _, sig = rest.partition(".")
+        if not (user_id and expires.isdigit() and sig):
+            return None
+        if not hmac.compare_digest(sig, self._sign(f"{user_id}.{expires}")):
+            return None
+        return user_id if int(expires) > time.time() else None
+
+    def _meta_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.pkl")
+
+    def _load(self):
+        for name in os.listdir(self.job_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, name), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job["status"] in ACTIVE:
+                job["status"], job["error"] = "interrupted", "Server restarted before the job finished"
+            self._jobs[job["id"]] = job
+        self.purge()
+
+    def _save(self, job: dict):
+        tmp = self._meta_path(job["id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, default=str)
+        os.replace(tmp, self._meta_path(job["id"]))
+
+    def _update(self, job_id: str, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            self._save(job)
+
+    def submit(self, user_id: str, fn, **meta) -> str:
+        """Run `fn(report_position)` in the background.
+
+        `fn` returns (df, changes): the result frame and a dict merged into the
+        job's metadata (exec_time, final sql...). Extra keyword arguments are
+        stored with the job (question, db, provider...).
+        """
+        self.purge()
+        job_id = uuid.uuid4().hex[:12]
+        job = dict(meta, id=job_id, user=user_id, status="queued",
+                   submitted_at=time.time(), queue_position=None)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._save(job)
+            self._pending.append((job_id, user_id, fn))
+            self._dispatch()
+        return job_id
+
+    def _fair_order(self) -> list:
+        """Pending indices in dispatch order: fewest busy workers first, then oldest."""
+        load = dict(self._busy)
+        order, rest = [], list(range(len(self._pending)))
+        while rest:
+            k = min(rest, key=lambda i: load.get(self._pending[i][1], 0))
+            rest.remove(k)
+            order.append(k)
+            user = self._pending[k][1]
+            load[user] = load.get(user, 0) + 1
+        return order
+
+    def _dispatch(self):
+        """Hand pending jobs to free workers; call with self._lock held."""
+        while sum(self._busy.values()) < self.max_workers:
+            k = next((i for i in self._fair_order()
+                      if self._busy[self._pending[i][1]] < self.per_user), None)
+            if k is None:
+                break
+            job_id, user_id, fn = self._pending.pop(k)
+            self._busy[user_id] += 1
+            self._pool.submit(self._run, job_id, user_id, fn)
+        for pos, k in enumerate(self._fair_order(), start=1):
+            job = self._jobs[self._pending[k][0]]
+            if job["queue_position"] != pos:
+                job["queue_position"] = pos
+                self._save(job)
+
+    def _run(self, job_id: str, user_id: str, fn):
+        def report_position(pos):
+            self._update(job_id, queue_position=pos)
+
+        self._update(job_id, status="running", started_at=time.time(), queue_position=None)
+        try:
+            df, changes = fn(report_position)
+            df.to_pickle(self._result_path(job_id))
+            self._update(job_id, **changes, status="done", finished_at=time.time(),
+                         rows=len(df), queue_position=None)
+        except Exception as e:
+            self._update(job_id, status="failed", finished_at=time.time(),
+                         error=str(e), queue_position=None)
+        finally:
+            with self._lock:
+                self._busy[user_id] -= 1
+                if not self._busy[user_id]:
+                    del self._busy[user_id]
+                self._dispatch()
+
+    def get(self, job_id: str, user_id: str | None = None) -> dict | None:
+        """Job metadata; with `user_id`, only if that user owns the job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (user_id is not None and job["user"] != user_id):
+                return None
+            return dict(job)
+
+    def result(self, job_id: str) -> pd.DataFrame:
+        return pd.read_pickle(self._result_path(job_id))
+
+    def list_jobs(self, user_id: str) -> list:
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values() if j["user"] == user_id]
+        return sorted(jobs, key=lambda j: j["submitted_at"], reverse=True)
+
+    def purge(self):
+        """Drop finished jobs (and their spilled results) older than JOB_RETENTION_S."""
+        cutoff = time.time() - JOB_RETENTION_S
+        with self._lock:
+            old = [j for j in self._jobs.values()
+                   if j["status"] not in ACTIVE and j["submitted_at"] < cutoff]
+            for job in old:
+                del self._jobs[job["id"]]
+                for path in (self._meta_path(job["id"]), self._result_path(job["id"])):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+job_manager = JobManager()
+
+def submit_query_job(user_id: str, nl_query: str, sql: str, db_name: str, schema: dict,
+                     provider: str, model: str, extra_schemas: dict | None = None,
+                     repair: dict | None = None) -> str:
+    """Queue execution of already-validated SQL, with routing, fair scheduling and
+    one repair pass on runtime SQL errors, exactly like the interactive path.
+
+    The SQL slot is released while the model repairs the query; the repair
+    itself takes an LLM slot like any other model call.
+    """
+    repair = repair or {"attempts": 0, "repaired": False, "errors": [], "repair_s": 0.0}
+
+    def run(query, report_position):
+        try:
+            est_rows = estimate_rows(query, db_name)
+        except Exception:
+            est_rows = None
+        targets = route_query(query, db_name, est_rows)
+        with sql_scheduler.slot(user_id, query_lane(est_rows), on_wait=report_position):
+            report_position(None)
+            return run_sql_query(query, db_name, targets)
+
+    def execute(report_position):
+        nonlocal sql
+        try:
+            df, exec_time, target = run(sql, report_position)
+        except ProgrammingError as e:
+            with llm_scheduler.slot(user_id, on_wait=report_position):
+                report_position(None)
+                sql, _ = repair_until_valid(nl_query, sql, db_name, schema, provider, model,
+                                            extra_schemas, error=str(e), stats=repair)
+            df, exec_time, target = run(sql, report_position)
+        return df, {"exec_time": exec_time, "sql": sql,
+                    "repairs": repair["attempts"], "target": target}
+
+    return job_manager.submit(
+        user_id, execute, nl=nl_query, sql=sql, db=db_name,
+        dbs=[db_name] + list(extra_schemas or {}), provider=provider, model=model,
+        repairs=repair["attempts"]
+    )
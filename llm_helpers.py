@@ -1,33 +1,109 @@
 import requests
-import json
-from config import GROQ_API_KEY, GROQ_ENDPOINT, OLLAMA_ENDPOINT
+import os
+import re
+import time
+import hashlib
+import threading
+from config import (
+    GROQ_API_KEY, GROQ_ENDPOINT, OLLAMA_ENDPOINT, OLLAMA_KEEP_ALIVE,
+    LOCAL_MODEL_DIR, LOCAL_N_CTX, LOCAL_N_THREADS, MAX_REPAIR_ATTEMPTS
+)
+from sql_helpers import validate_sql, explain_sql
+from scheduler import rate_limit
+from schema_store import CompactSchema, as_plain, canonical_json, fingerprint_of
 
-def nl_to_sql_groq(nl_query: str, db_name: str, schema: dict, model: str) -> str:
-    """Turn NL request into pure SQL via Groq."""
-    schema_json = json.dumps(schema, indent=2)
-    system_prompt = f"""
-You are an expert MySQL assistant.
-The database `{db_name}` has this schema:
-{schema_json}
+# One pooled HTTP session per process keeps TLS/keep-alive connections warm
+_http = requests.Session()
+
+# ── Prompt Building ────────────────────────────────────────────────────────────
+# The system prompt is laid out static-first so providers can cache it: the
+# rules never change, the schema block only changes with the schema version,
+# and everything per-question lives in the user message.
+SQL_RULES = """You are an expert MySQL assistant.
 
 Rules:
-• Generate ONLY safe SELECT statements.
-• Use ONLY the tables/columns shown above.
-• Add LIMIT 100 to big-result queries unless user says otherwise.
-• Return ONLY the raw SQL (no markdown, no explanation).
-• Use INNER JOIN, LEFT JOIN, RIGHT JOIN, FULL JOIN, CROSS JOIN, SELF JOIN according to the nl query don't use only JOIN.
+- Generate ONLY safe SELECT statements.
+- Use ONLY the tables/columns in the schema below.
+- Add LIMIT 100 to big-result queries unless user says otherwise.
+- Return ONLY the raw SQL (no markdown, no explanation).
+- Use INNER JOIN, LEFT JOIN, RIGHT JOIN, FULL JOIN, CROSS JOIN, SELF JOIN according to the nl query don't use only JOIN.
+- Reference tables from other listed databases as `db`.`table`.
 """
+MAX_CACHED_PROMPTS = 64
+
+_prompt_cache = {}
+_prompt_cache_lock = threading.Lock()
+
+def schema_fingerprint(schema: dict) -> str:
+    """Short content hash identifying one version of a schema."""
+    if isinstance(schema, CompactSchema):
+        return schema.fingerprint
+    return fingerprint_of(as_plain(schema))
+
+def build_system_prompt(db_name: str, schema: dict, extra_schemas: dict | None = None) -> str:
+    """Byte-stable system prompt for a (database, schema version) pair."""
+    extra_schemas = extra_schemas or {}
+    key = (db_name, schema_fingerprint(schema),
+           tuple((db, schema_fingerprint(sch)) for db, sch in sorted(extra_schemas.items())))
+    with _prompt_cache_lock:
+        prompt = _prompt_cache.get(key)
+    if prompt is None:
+        blocks = [f"Database `{db_name}` (default) schema:\n{canonical_json(as_plain(schema))}"]
+        blocks += [f"Database `{db}` schema:\n{canonical_json(as_plain(sch))}"
+                   for db, sch in sorted(extra_schemas.items())]
+        prompt = SQL_RULES + "\n" + "\n\n".join(blocks) + "\n"
+        with _prompt_cache_lock:
+            if key not in _prompt_cache and len(_prompt_cache) >= MAX_CACHED_PROMPTS:
+                _prompt_cache.pop(next(iter(_prompt_cache)))
+            prompt = _prompt_cache.setdefault(key, prompt)
+    return prompt
+
+def build_user_prompt(nl_query: str, db_name: str, value_hints: str = "") -> str:
+    """Per-question message; sampled column values go here to keep the system prefix stable."""
+    prompt = f"Database: {db_name}\nQuery: {nl_query}"
+    if value_hints:
+        prompt += f"\nKnown column values (use these exact literals):\n{value_hints}"
+    return prompt
+
+def _clean_sql(content: str) -> str:
+    lines = [ln for ln in content.splitlines()
+             if ln.strip() and not ln.lower().startswith(("sql", "```"))]
+    return " ".join(lines).replace("`", "").strip()
+
+# ── Prefix-Cache Statistics ────────────────────────────────────────────────────
+_cache_stats = {}
+_cache_stats_lock = threading.Lock()
+
+def record_prefix_cache(provider: str, prompt_tokens: int, cached_tokens: int, saved_s: float):
+    """Accumulate per-provider prompt-prefix cache hits and estimated time saved."""
+    with _cache_stats_lock:
+        st = _cache_stats.setdefault(provider, {
+            "requests": 0, "hits": 0, "prompt_tokens": 0, "cached_tokens": 0, "saved_s": 0.0
+        })
+        st["requests"] += 1
+        st["hits"] += int(cached_tokens > 0)
+        st["prompt_tokens"] += prompt_tokens
+        st["cached_tokens"] += cached_tokens
+        st["saved_s"] += saved_s
+
+def get_prefix_cache_stats() -> dict:
+    with _cache_stats_lock:
+        return {p: dict(st) for p, st in _cache_stats.items()}
+
+# ── Groq ───────────────────────────────────────────────────────────────────────
+def _groq_chat(model: str, system_prompt: str, user_prompt: str, max_tokens: int = 512) -> str:
+    rate_limit("Groq")
     payload = {
         "model": model,
         "messages": [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Database: {db_name}\nQuery: {nl_query}"}
+            {"role": "user", "content": user_prompt}
         ],
-        "max_tokens": 512,
+        "max_tokens": max_tokens,
         "temperature": 0.1
     }
-    
-    res = requests.post(
+
+    res = _http.post(
         GROQ_ENDPOINT,
         headers={
             "Authorization": f"Bearer {GROQ_API_KEY}",
@@ -35,65 +111,287 @@ Rules:
         },
         json=payload
     )
-    
+
     if not res.ok:
         raise Exception(f"GROQ API {res.status_code}: {res.text}")
 
-    content = res.json()["choices"][0]["message"]["content"]
-    lines = [ln for ln in content.splitlines()
-             if ln.strip() and not ln.lower().startswith(("sql", "```"))
-            ]
-    return " ".join(lines).replace("`", "").strip()
+    body = res.json()
+    usage = body.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+    uncached = max(1, prompt_tokens - cached)
+    record_prefix_cache("Groq", prompt_tokens, cached,
+                        cached * usage.get("prompt_time", 0.0) / uncached)
 
-def nl_to_sql_ollama(nl_query: str, db_name: str, schema: dict, model: str) -> str:
-    """Turn NL request into pure SQL via Ollama."""
-    schema_json = json.dumps(schema, indent=2)
-    system_prompt = f"""
-You are an expert MySQL assistant.
-The database `{db_name}` has this schema:
-{schema_json}
+    return body["choices"][0]["message"]["content"]
 
-Rules:
--  Generate ONLY safe SELECT statements.
--  Use ONLY the tables/columns shown above.
--  Add LIMIT 100 to big-result queries unless user says otherwise.
--  Return ONLY the raw SQL (no markdown, no explanation).
--  Use INNER JOIN, LEFT JOIN, RIGHT JOIN, FULL JOIN, CROSS JOIN, SELF JOIN according to the nl query don't use only JOIN.
-"""
-    
+def nl_to_sql_groq(nl_query: str, db_name: str, schema: dict, model: str,
+                   extra_schemas: dict | None = None, value_hints: str = "") -> str:
+    """Turn NL request into pure SQL via Groq."""
+    return _clean_sql(_groq_chat(model, build_system_prompt(db_name, schema, extra_schemas),
+                                 build_user_prompt(nl_query, db_name, value_hints)))
+
+# ── Ollama ─────────────────────────────────────────────────────────────────────
+# Ollama reuses the KV-cache of a loaded model when a new prompt shares its
+# prefix; keep_alive keeps the model (and that cache) resident between calls.
+# prompt_eval_count only counts tokens that were actually evaluated, so the
+# size seen on the cold request for a system prompt estimates the reused prefix.
+_ollama_prompt_sizes = {}
+
+def _ollama_chat(model: str, system_prompt: str, user_prompt: str, max_tokens: int = 512) -> str:
+    rate_limit("Ollama")
     payload = {
         "model": model,
         "messages": [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Database: {db_name}\nQuery: {nl_query}"}
+            {"role": "user", "content": user_prompt}
         ],
         "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
         "options": {
             "temperature": 0.1,
-            "num_predict": 512
+            "num_predict": max_tokens
         }
     }
-    
+
     try:
-        res = requests.post(OLLAMA_ENDPOINT, json=payload, timeout=30)
+        res = _http.post(OLLAMA_ENDPOINT, json=payload, timeout=30)
         if not res.ok:
             raise Exception(f"Ollama API {res.status_code}: {res.text}")
-        
-        content = res.json()["message"]["content"]
-        lines = [ln for ln in content.splitlines()
-                 if ln.strip() and not ln.lower().startswith(("sql", "```"))]
-        return " ".join(lines).replace("`", "").strip()
-        
+
+        body = res.json()
+        evaluated = body.get("prompt_eval_count", 0)
+        key = (model, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16])
+        full = _ollama_prompt_sizes.setdefault(key, evaluated)
+        cached = max(0, full - evaluated)
+        per_token_s = body.get("prompt_eval_duration", 0) / 1e9 / max(1, evaluated)
+        record_prefix_cache("Ollama", full, cached, cached * per_token_s)
+
+        return body["message"]["content"]
+
     except requests.exceptions.ConnectionError:
         raise Exception("Cannot connect to Ollama. Make sure Ollama is running on localhost:11434")
     except requests.exceptions.Timeout:
         raise Exception("Ollama request timed out. The model might be loading.")
 
-def nl_to_sql(nl_query: str, db_name: str, schema: dict, provider: str, model: str) -> str:
-    """Main function to route to appropriate LLM provider."""
+def nl_to_sql_ollama(nl_query: str, db_name: str, schema: dict, model: str,
+                     extra_schemas: dict | None = None, value_hints: str = "") -> str:
+    """Turn NL request into pure SQL via Ollama."""
+    return _clean_sql(_ollama_chat(model, build_system_prompt(db_name, schema, extra_schemas),
+                                   build_user_prompt(nl_query, db_name, value_hints)))
+
+# ── Local llama.cpp Backend ────────────────────────────────────────────────────
+# Grammar-constrained decoding: the model can only emit one SELECT ending in ';'
+SELECT_GRAMMAR = r'''
+root ::= "SELECT" [ \t\n] body ";"
+body ::= [^;]+
+'''
+MAX_PREFIX_STATES = 4
+
+_local_models = {}
+_local_models_lock = threading.Lock()
+
+def _load_local_model(model: str) -> dict:
+    """Load a GGUF model once per process, warm it up and keep it resident."""
+    with _local_models_lock:
+        entry = _local_models.get(model)
+        if entry is not None:
+            return entry
+        try:
+            from llama_cpp import Llama, LlamaGrammar
+        except ImportError:
+            raise Exception("Local provider needs llama.cpp bindings: pip install llama-cpp-python")
+
+        path = os.path.join(LOCAL_MODEL_DIR, model)
+        if not os.path.exists(path):
+            raise Exception(f"Local model not found: {path}")
+
+        llm = Llama(model_path=path, n_ctx=LOCAL_N_CTX,
+                    n_threads=LOCAL_N_THREADS, verbose=False)
+        llm.create_completion("SELECT 1;", max_tokens=1)      # warm-up: page in weights
+        entry = _local_models[model] = {
+            "llm": llm,
+            "grammar": LlamaGrammar.from_string(SELECT_GRAMMAR, verbose=False),
+            "prefix_states": {},          # sha256(prefix) -> (saved KV-cache state, n_tokens, eval_s)
+            "lock": threading.Lock(),     # a Llama context is not thread-safe
+        }
+        return entry
+
+def _local_prefix_state(entry: dict, prefix: str):
+    """Evaluate the static schema prefix once and snapshot its KV-cache.
+
+    Returns (state, n_tokens, eval_s, hit).
+    """
+    key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+    states = entry["prefix_states"]
+    if key in states:
+        return (*states[key], True)
+    llm = entry["llm"]
+    tokens = llm.tokenize(prefix.encode("utf-8"))
+    t0 = time.time()
+    llm.reset()
+    llm.eval(tokens)
+    if len(states) >= MAX_PREFIX_STATES:
+        states.pop(next(iter(states)))
+    states[key] = (llm.save_state(), len(tokens), time.time() - t0)
+    return (*states[key], False)
+
+def _local_complete(model: str, system_prompt: str, user_prompt: str, max_tokens: int = 512) -> str:
+    rate_limit("Local")
+    entry = _load_local_model(model)
+    with entry["lock"]:
+        llm = entry["llm"]
+        # Restoring the snapshot lets llama.cpp skip re-evaluating the shared prefix
+        state, n_tokens, eval_s, hit = _local_prefix_state(entry, system_prompt)
+        llm.load_state(state)
+        out = llm.create_completion(
+            system_prompt + "\n" + user_prompt + "\nSQL:\n",
+            grammar=entry["grammar"],
+            max_tokens=max_tokens,
+            temperature=0.1
+        )
+    record_prefix_cache("Local", n_tokens, n_tokens if hit else 0, eval_s if hit else 0.0)
+    return " ".join(out["choices"][0]["text"].split()).rstrip(";").strip()
+
+def nl_to_sql_local(nl_query: str, db_name: str, schema: dict, model: str,
+                    extra_schemas: dict | None = None, value_hints: str = "") -> str:
+    """Turn NL request into pure SQL with an in-process quantized model (llama.cpp, CPU)."""
+    return _local_complete(model, build_system_prompt(db_name, schema, extra_schemas),
+                           build_user_prompt(nl_query, db_name, value_hints))
+
+def nl_to_sql(nl_query: str, db_name: str, schema: dict, provider: str, model: str,
+              extra_schemas: dict | None = None, value_hints: str = "") -> str:
+    """Main function to route to appropriate LLM provider.
+
+    `extra_schemas` maps other database names to their schemas for questions
+    that span databases; the model is told to qualify those tables.
+    `value_hints` lists sampled literals for the columns the question is about.
+    """
+    if provider == "Groq":
+        return nl_to_sql_groq(nl_query, db_name, schema, model, extra_schemas, value_hints)
+    elif provider == "Ollama":
+        return nl_to_sql_ollama(nl_query, db_name, schema, model, extra_schemas, value_hints)
+    elif provider == "Local":
+        return nl_to_sql_local(nl_query, db_name, schema, model, extra_schemas, value_hints)
+    else:
+        raise Exception(f"Unknown provider: {provider}")
+
+# ── Error-Driven Repair ────────────────────────────────────────────────────────
+# Much shorter than the generation prompt: only the failing SQL, the MySQL
+# error and the tables the SQL actually touches are sent back to the model.
+REPAIR_RULES = """You fix broken MySQL SELECT statements.
+Return ONLY the corrected raw SQL (no markdown, no explanation), as a single SELECT.
+Use ONLY the tables/columns listed.
+"""
+
+_repair_stats = {"sessions": 0, "attempts": 0, "repaired": 0, "failed": 0, "repair_s": 0.0}
+_repair_stats_lock = threading.Lock()
+
+def schema_slice(sql: str, schema: dict, extra_schemas: dict | None = None) -> dict:
+    """Subset of the schema(s) for tables referenced in `sql`, keyed `table` or `db.table`."""
+    words = set(re.findall(r"[A-Za-z0-9_$]+", sql.lower()))
+    picked = {t: info for t, info in schema.items() if t.lower() in words}
+    for db, sch in (extra_schemas or {}).items():
+        picked.update({f"{db}.{t}": info for t, info in sch.items() if t.lower() in words})
+    return picked
+
+def check_sql(sql: str, db_name: str):
+    """Safety check plus EXPLAIN; returns (ok, error_message)."""
+    ok, msg = validate_sql(sql)
+    if not ok:
+        return False, msg
+    return explain_sql(sql, db_name)
+
+def repair_sql(nl_query: str, sql: str, error: str, db_name: str, schema: dict,
+               provider: str, model: str, extra_schemas: dict | None = None) -> str:
+    """Ask the model to fix `sql` given the error it produced."""
+    relevant = schema_slice(sql, schema, extra_schemas)
+    user_prompt = (
+        f"Database: {db_name}\n"
+        f"Question: {nl_query}\n"
+        f"Failing SQL: {sql}\n"
+        f"Error: {error}\n"
+        f"Relevant schema: {canonical_json(as_plain(relevant))}\n"
+        f"All tables: {', '.join(sorted(schema))}"
+    )
     if provider == "Groq":
-        return nl_to_sql_groq(nl_query, db_name, schema, model)
+        return _clean_sql(_groq_chat(model, REPAIR_RULES, user_prompt, max_tokens=256))
     elif provider == "Ollama":
-        return nl_to_sql_ollama(nl_query, db_name, schema, model)
+        return _clean_sql(_ollama_chat(model, REPAIR_RULES, user_prompt, max_tokens=256))
+    elif provider == "Local":
+        return _local_complete(model, REPAIR_RULES, user_prompt, max_tokens=256)
     else:
         raise Exception(f"Unknown provider: {provider}")
+
+def repair_until_valid(nl_query: str, sql: str, db_name: str, schema: dict,
+                       provider: str, model: str, extra_schemas: dict | None = None,
+                       error: str | None = None, stats: dict | None = None,
+                       max_attempts: int = MAX_REPAIR_ATTEMPTS):
+    """Repair `sql` until it passes validation and EXPLAIN, within `max_attempts`.
+
+    Pass `error` when the SQL already failed (e.g. at execution). The same
+    `stats` dict can be threaded through several calls so the attempt budget
+    is shared. Returns (sql, stats); raises if the budget runs out.
+    Validation failures are repaired too: every candidate is re-checked, so
+    unsafe SQL can never come out of here.
+    """
+    if stats is None:
+        stats = {"attempts": 0, "repaired": False, "errors": [], "repair_s": 0.0}
+    if error is None:
+        ok, error = check_sql(sql, db_name)
+        if ok:
+            return sql, stats
+
+    ok, first_attempt, spent = False, stats["attempts"], 0.0
+    try:
+        while stats["attempts"] < max_attempts:
+            stats["attempts"] += 1
+            stats["errors"].append(error)
+            t0 = time.time()
+            try:
+                sql = repair_sql(nl_query, sql, error, db_name, schema, provider, model, extra_schemas)
+                ok, error = check_sql(sql, db_name)
+            finally:
+                spent += time.time() - t0
+            if ok:
+                stats["repaired"] = True
+                break
+    finally:
+        stats["repair_s"] += spent
+        # One outcome per stats dict (= per question): a later call replaces it
+        outcome, previous = ("repaired" if ok else "failed"), stats.get("outcome")
+        stats["outcome"] = outcome
+        with _repair_stats_lock:
+            _repair_stats["sessions"] += int(previous is None)
+            _repair_stats["attempts"] += stats["attempts"] - first_attempt
+            _repair_stats["repair_s"] += spent
+            if previous:
+                _repair_stats[previous] -= 1
+            _repair_stats[outcome] += 1
+
+    if not ok:
+        raise Exception(f"SQL still failing after {stats['attempts']} repair attempt(s): {error}")
+    return sql, stats
+
+def nl_to_sql_checked(nl_query: str, db_name: str, schema: dict, provider: str, model: str,
+                      extra_schemas: dict | None = None, value_hints: str = ""):
+    """Generate SQL and auto-repair it until it can be EXPLAINed. Returns (sql, stats)."""
+    sql = nl_to_sql(nl_query, db_name, schema, provider, model, extra_schemas, value_hints)
+    return repair_until_valid(nl_query, sql, db_name, schema, provider, model, extra_schemas)
+
+def get_repair_stats() -> dict:
+    with _repair_stats_lock:
+        return dict(_repair_stats)
+
+# ── Warm-Up ────────────────────────────────────────────────────────────────────
+def warm_up_provider(provider: str, model: str):
+    """Open the provider connection / load the model ahead of the first question."""
+    if provider == "Groq":
+        _http.get(GROQ_ENDPOINT.rsplit("/chat/", 1)[0] + "/models",
+                  headers={"Authorization": f"Bearer {GROQ_API_KEY}"}, timeout=10)
+    elif provider == "Ollama":
+        # An empty message list makes Ollama load the model and keep it resident
+        _http.post(OLLAMA_ENDPOINT, json={"model": model, "messages": [],
+                                          "keep_alive": OLLAMA_KEEP_ALIVE}, timeout=120)
+    elif provider == "Local":
+        _load_local_model(model)
@@ -1,10 +1,18 @@
 import streamlit as st
 import pandas as pd
-from llm_helpers import nl_to_sql
-from sql_helpers import get_db_schema, run_sql_query, validate_sql
+import uuid
+from llm_helpers import nl_to_sql_checked
+from warmup import schema_preloader, schema_watcher, warm_up
+from schema_watcher import describe_change
+from db_routing import all_targets, has_secondaries, ensure_monitor
+import duckdb_accel
+from profiler import ensure_profiled, value_hints
+from jobs import job_manager, submit_query_job, ACTIVE
+from scheduler import llm_scheduler, sql_scheduler
 from ui_components import (
     inject_css, show_header, schema_expander, save_history, 
-    show_enhanced_history, display_query_results, show_provider_selection
+    show_enhanced_history, display_query_results, show_provider_selection,
+    show_prefix_cache_stats, show_repair_stats, show_job_status, show_job_list
 )
 from config import DATABASES
 
@@ -19,6 +27,23 @@ st.set_page_config(
 inject_css()
 show_header()
 
+# ── Shared Schema Preloader ────────────────────────────────────────────────────
+preloader = schema_preloader()
+watcher = schema_watcher()
+
+@st.fragment(run_every=1)
+def show_preload_progress():
+    # A live schema change reruns the whole app so the new schema is applied
+    if (st.session_state.get("curr_db")
+            and watcher.version(st.session_state.curr_db) != st.session_state.get("schema_version")):
+        st.rerun()
+    done, total = preloader.progress()
+    if done < total:
+        st.progress(done / total, text=f"⏳ Preloading schemas {done}/{total}...")
+    elif total:
+        failed = preloader.errors()
+        st.caption(f"✅ {total - len(failed)}/{total} schemas cached")
+
 # ── Session State ──────────────────────────────────────────────────────────────
 if "schema" not in st.session_state: 
     st.session_state.schema = {}
@@ -30,6 +55,14 @@ if "show_schema" not in st.session_state:
     st.session_state.show_schema = False
 if "show_hist" not in st.session_state: 
     st.session_state.show_hist = False
+if "user_id" not in st.session_state: 
+    # Identity is issued here; the URL only carries a signed token for it so a
+    # reopened tab finds its background jobs again. Unsigned ids are ignored.
+    st.session_state.user_id = (job_manager.resolve_token(st.query_params.get("uid"))
+                                or uuid.uuid4().hex)
+    st.query_params["uid"] = job_manager.issue_token(st.session_state.user_id)
+if "saved_jobs" not in st.session_state: 
+    st.session_state.saved_jobs = set()
 
 # ── Enhanced Sidebar ───────────────────────────────────────────────────────────
 with st.sidebar:
@@ -37,6 +70,7 @@ with st.sidebar:
     
     # AI Provider and Model Selection
     provider, model = show_provider_selection()
+    warm_up(provider, model)
     
     st.markdown("---")
     
@@ -48,17 +82,35 @@ with st.sidebar:
         help="Choose the database you want to query"
     )
     
+    show_preload_progress()
+    
     # Schema loading with better UX
     if db != st.session_state.curr_db:
         with st.spinner(f"🔄 Loading schema for {db}..."):
             try:
-                st.session_state.schema = get_db_schema(db)
+                st.session_state.schema_version = watcher.version(db)
+                st.session_state.schema = preloader.get(db)
                 st.session_state.curr_db = db
+                ensure_profiled(db)
                 st.success(f"✅ Schema loaded for {db}!")
             except Exception as e:
                 st.session_state.schema = {}
                 st.error(f"❌ Error loading schema: {e}")
     
+    elif watcher.version(db) != st.session_state.get("schema_version"):
+        # Picked up by the schema watcher: swap in the incrementally refreshed schema
+        st.session_state.schema_version = watcher.version(db)
+        st.session_state.schema = preloader.get(db)
+        st.toast(f"🔄 Schema of {db} changed: {describe_change(watcher.changes.get(db, {}))}")
+    
+    # Cross-database questions
+    extra_dbs = st.multiselect(
+        "🔗 Also query databases",
+        [d for d in DATABASES if d != db],
+        key="extra_dbs",
+        help="Tables from these databases are offered to the model as `db`.`table`"
+    )
+    
     st.markdown("---")
     
     # Action buttons
@@ -78,9 +130,35 @@ with st.sidebar:
         total_cols = sum(len(info['columns']) for info in st.session_state.schema.values())
         st.metric("Total Columns", total_cols)
     
+    show_prefix_cache_stats()
+    show_repair_stats()
+    for name, sched in [("LLM", llm_scheduler), ("SQL", sql_scheduler)]:
+        load = sched.snapshot()
+        st.caption(f"🚦 {name}: {load['running']}/{load['limit']} busy • {load['queued']} queued")
+    
+    if has_secondaries():
+        ensure_monitor()
+        with st.expander("🎯 Execution Targets"):
+            for t in all_targets():
+                lag = (f" • lag {t.lag_s}s" if t.lag_s is not None
+                       else " • replication stopped" if t.replicating else "")
+                icon = "🟢" if t.healthy else "🔴" if t.checked_at else "⏳"
+                st.write(f"{icon} **{t.name}** ({t.role}){lag}")
+    
+    if duckdb_accel.enabled():
+        duckdb_accel.ensure_refresher()
+        acc = duckdb_accel.get_accel_stats()
+        st.caption(f"🦆 Local snapshots: {acc['tables']} tables • "
+                   f"{acc['local']} served locally / {acc['fallback']} via MySQL • "
+                   f"{acc['rows_deleted']} deleted rows reconciled")
+    
+    picked = show_job_list(job_manager.list_jobs(st.session_state.user_id))
+    if picked:
+        st.session_state.active_job = picked
+    
     # Current configuration display
     st.markdown("### ⚙️ Current Config")
-    st.info(f"**Provider:** {provider}\n**Model:** {model}\n**Database:** {db}")
+    st.info(f"**Provider:** {provider}\n**Model:** {model}\n**Database:** {', '.join([db] + extra_dbs)}")
     
     st.markdown("---")
     st.markdown("### 💡 Tips")
@@ -117,36 +195,75 @@ if run_button and nl_query:
         st.error("❌ Please load a database schema first by selecting a database.")
     else:
         try:
-            # Generate SQL
-            with st.spinner(f"🧠 Generating SQL using {provider} ({model})..."):
-                sql = nl_to_sql(nl_query, db, st.session_state.schema, provider, model)
+            queue_note = st.empty()
+            def show_queue_position(pos):
+                queue_note.info(f"⏳ Waiting for a free LLM slot — position {pos} in queue")
             
-            # Validate SQL
-            ok, msg = validate_sql(sql)
-            if not ok:
-                st.error(f"❌ SQL Validation Failed: {msg}")
-            else:
-                # Display generated SQL with provider info
-                st.markdown("### 🔧 Generated SQL")
-                st.info(f"Generated using **{provider}** with model **{model}**")
-                st.code(sql, language="sql")
-                
-                # Execute query
-                with st.spinner("⚡ Executing query..."):
-                    df, execution_time = run_sql_query(sql, db)
-                
-                # Save to history
-                save_history(nl_query, sql, db, execution_time, provider, model, len(df))
-                
-                # Display results
-                st.success(f"✅ Query executed successfully!")
-                display_query_results(df, execution_time)
+            # Generate SQL, auto-repairing it until MySQL can EXPLAIN it
+            with llm_scheduler.slot(st.session_state.user_id, on_wait=show_queue_position):
+                queue_note.empty()
+                with st.spinner(f"🧠 Generating SQL using {provider} ({model})..."):
+                    extra_schemas = {d: preloader.get(d) for d in extra_dbs}
+                    hints = value_hints(nl_query, db)
+                    sql, repair = nl_to_sql_checked(nl_query, db, st.session_state.schema,
+                                                    provider, model, extra_schemas, hints)
+            
+            # Display generated SQL with provider info
+            st.markdown("### 🔧 Generated SQL")
+            st.info(f"Generated using **{provider}** with model **{model}**")
+            st.code(sql, language="sql")
+            if repair["repaired"]:
+                st.caption(f"🛠️ Auto-repaired in {repair['attempts']} attempt(s) "
+                           f"({repair['repair_s']:.2f}s): {repair['errors'][0]}")
+            if hints:
+                with st.expander("🏷️ Column value hints sent to the model"):
+                    st.code(hints, language="text")
+            
+            # Execute in the background: the job survives reruns and closed tabs
+            job_id = submit_query_job(
+                st.session_state.user_id, nl_query, sql, db, st.session_state.schema,
+                provider, model, extra_schemas, repair
+            )
+            st.session_state.active_job = job_id
                 
         except Exception as e:
             st.error(f"❌ Error: {str(e)}")
             if "Ollama" in str(e):
                 st.info("💡 **Tip:** Make sure Ollama is running and the selected model is downloaded.")
                 st.code("ollama pull " + model, language="bash")
+            elif provider == "Local":
+                st.info("💡 **Tip:** Install `llama-cpp-python` and place the GGUF file in `LOCAL_MODEL_DIR`.")
+
+# ── Background Query Jobs ──────────────────────────────────────────────────────
+@st.cache_resource(max_entries=16, show_spinner=False)
+def load_job_result(job_id, finished_at):
+    """Unpickle a finished job's frame once, not on every rerun (read-only)."""
+    return job_manager.result(job_id)
+
+@st.fragment(run_every=1)
+def poll_active_job(job_id):
+    """Refresh the status line until the job settles, then rerun to show results."""
+    job = job_manager.get(job_id, st.session_state.user_id)
+    if job and job["status"] in ACTIVE:
+        show_job_status(job)
+    else:
+        st.rerun()
+
+active_job = job_manager.get(st.session_state.get("active_job") or "", st.session_state.user_id)
+if active_job:
+    st.markdown("---")
+    if active_job["status"] in ACTIVE:
+        poll_active_job(active_job["id"])
+    else:
+        show_job_status(active_job)
+        if active_job["status"] == "done":
+            if active_job["id"] not in st.session_state.saved_jobs:
+                save_history(active_job["nl"], active_job["sql"], ", ".join(active_job["dbs"]),
+                             active_job["exec_time"], active_job["provider"], active_job["model"],
+                             active_job["rows"], repairs=active_job.get("repairs", 0))
+                st.session_state.saved_jobs.add(active_job["id"])
+            display_query_results(load_job_result(active_job["id"], active_job["finished_at"]),
+                                  active_job["exec_time"], active_job["sql"], active_job["db"])
 
 # ── Schema and History Display ─────────────────────────────────────────────────
 if st.session_state.get("show_schema"):
@@ -164,6 +281,6 @@ st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #666; padding: 2rem;'>
     <p>🤖 Powered by AI • Built with Streamlit • Enhanced Database Query Experience</p>
-    <p style='font-size: 0.9em; opacity: 0.7;'>Supports both Groq Cloud API and Local Ollama models</p>
+    <p style='font-size: 0.9em; opacity: 0.7;'>Supports Groq Cloud API, Local Ollama models and in-process llama.cpp</p>
 </div>
 """, unsafe_allow_html=True)
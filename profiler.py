@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import numbers
+import datetime
+import time
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from config import PROFILE_DIR, PROFILE_SAMPLE_ROWS, PROFILE_TOP_N, PROFILE_MAX_AGE_S
+from db_routing import plan_targets
+
+# Background column profiler. Each table is sampled with a bounded LIMIT
+# scan and summarised per column (distinct count, min/max, top-N values) into
+# a small JSON index per database. A refresh only re-samples tables whose
+# information_schema stamp (UPDATE_TIME, TABLE_ROWS) changed or whose
+# profile is older than PROFILE_MAX_AGE_S.
+
+MAX_VALUE_LEN = 40
+MAX_HINTS = 8
+LOW_CARDINALITY = 50          # only columns this categorical get top-value hints
+
+_profiles = {}
+_in_flight = set()
+_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler")
+
+def _path(db_name: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{db_name}.json")
+
+def _bound(value):
+    """JSON-friendly min/max for numeric and date columns, None for anything else.
+
+    Numbers stay numbers so hints show unquoted literals; dates are kept whole.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Number):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return str(value)
+    return None
+
+# ── Profiling ──────────────────────────────────────────────────────────────────
+def profile_column(series: pd.Series) -> dict:
+    values = series.dropna()
+    info = {"distinct": int(values.nunique())}
+    if values.empty:
+        return info
+    try:
+        lo, hi = _bound(values.min()), _bound(values.max())
+    except TypeError:
+        lo = hi = None                            # mixed/unorderable types
+    if lo is not None and hi is not None:
+        info["min"], info["max"] = lo, hi         # no ranges for text: they'd be cut literals
+    if info["distinct"] <= LOW_CARDINALITY and values.map(type).eq(str).all():
+        # Hints are used as exact literals, so long values are skipped, never cut
+        top = [v for v in values.value_counts().index if len(v) <= MAX_VALUE_LEN]
+        info["top"] = top[:PROFILE_TOP_N]
+    return info
+
+def _table_stamps(cur, db_name: str) -> dict:
+    cur.execute(
+        "SELECT TABLE_NAME, UPDATE_TIME, TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = %s", (db_name,))
+    return {t: f"{u}|{r}" for t, u, r in cur.fetchall()}
+
+def refresh_profile(db_name: str) -> dict:
+    """Re-profile changed or stale tables of `db_name` and persist the index."""
+    # Work on a copy so readers never see a half-updated index
+    tables = dict(load_profile(db_name).get("tables", {}))
+    index = {"tables": tables}
+    cnx = plan_targets(None)[0].connect(db_name)
+    cur = cnx.cursor()
+    try:
+        stamps = _table_stamps(cur, db_name)
+        for gone in set(tables) - set(stamps):
+            del tables[gone]
+        now = time.time()
+        for tbl, stamp in stamps.items():
+            prev = tables.get(tbl)
+            if prev and prev["stamp"] == stamp and now - prev["profiled_at"] < PROFILE_MAX_AGE_S:
+                continue
+            try:
+                cur.execute(f"SELECT * FROM `{tbl}` LIMIT {int(PROFILE_SAMPLE_ROWS)}")
+                sample = pd.DataFrame(cur.fetchall(), columns=[c[0] for c in cur.description])
+            except Exception as e:
+                print(f"⚠️  Profiling `{tbl}` failed: {e}")
+                continue
+            tables[tbl] = {
+                "stamp": stamp,
+                "profiled_at": now,
+                "sampled_rows": len(sample),
+                "columns": {c: profile_column(sample[c]) for c in sample.columns},
+            }
+    finally:
+        cur.close(); cnx.close()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp = _path(db_name) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp, _path(db_name))
+    with _lock:
+        _profiles[db_name] = index
+    return index
+
+def load_profile(db_name: str) -> dict:
+    """In-memory index for `db_name`, read from disk on first use."""
+    with _lock:
+        if db_name in _profiles:
+            return _profiles[db_name]
+    try:
+        with open(_path(db_name), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {"tables": {}}
+    with _lock:
+        return _profiles.setdefault(db_name, index)
+
+def invalidate_tables(db_name: str, tables):
+    """Forget profiles of `tables` (schema changed) and queue their re-profiling."""
+    if not tables:
+        return
+    index = load_profile(db_name)
+    kept = {t: p for t, p in index.get("tables", {}).items() if t not in set(tables)}
+    with _lock:
+        _profiles[db_name] = {"tables": kept}
+    ensure_profiled(db_name)
+
+def ensure_profiled(db_name: str):
+    """Queue a background refresh of `db_name` unless one is already running."""
+    with _lock:
+        if db_name in _in_flight:
+            return
+        _in_flight.add(db_name)
+
+    def job():
+        try:
+            refresh_profile(db_name)
+        except Exception as e:
+            print(f"⚠️  Profiling {db_name} failed: {e}")
+        finally:
+            with _lock:
+                _in_flight.discard(db_name)
+
+    _pool.submit(job)
+
+# ── Prompt Hints ───────────────────────────────────────────────────────────────
+def value_hints(nl_query: str, db_name: str, limit: int = MAX_HINTS) -> str:
+    """Top values of the columns a question is likely about, one line per column.
+
+    A column is relevant when the question mentions its name, its table's
+    name, or one of its known values.
+    """
+    q = nl_query.lower()
+    words = set(re.findall(r"[a-z0-9_]+", q))
+    scored = []
+    for tbl, tinfo in load_profile(db_name).get("tables", {}).items():
+        for col, cinfo in tinfo.get("columns", {}).items():
+            top = cinfo.get("top") or []
+            named = col.lower() in words
+            if not top and not (named and "min" in cinfo):
+                continue
+            mentioned = sum(1 for v in top
+                            if (v.lower() in q if len(v) > 2 else v.lower() in words))
+            score = (3 * mentioned
+                     + 2 * named
+                     + bool(top and (tbl.lower() in words or tbl.lower().rstrip("s") in words)))
+            if score:
+                scored.append((score, tbl, col, cinfo))
+    scored.sort(key=lambda x: -x[0])
+    lines = []
+    for _, tbl, col, cinfo in scored[:limit]:
+        if cinfo.get("top"):
+            values = ", ".join(repr(v) for v in cinfo["top"])
+            lines.append(f"{tbl}.{col}: {values} ({cinfo['distinct']} distinct)")
+        else:
+            lines.append(f"{tbl}.{col}: ranges {cinfo['min']!r} .. {cinfo['max']!r}")
+    return "\n".join(lines)
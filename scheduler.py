@@ -0,0 +1,127 @@
+import time
+import itertools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from config import (
+    LLM_MAX_CONCURRENCY, LLM_MAX_PER_USER, SQL_MAX_CONCURRENCY, SQL_MAX_PER_USER,
+    PROVIDER_RPM, CHEAP_QUERY_ROWS
+)
+
+# Process-wide admission control shared by every Streamlit session: one
+# scheduler for LLM calls, one for MySQL queries, and a token bucket per
+# provider so a burst from one user can't drain the provider rate limit.
+
+LANE_FAST = 0      # cheap queries jump ahead of heavy ones
+LANE_NORMAL = 1
+
+# ── Token Bucket ───────────────────────────────────────────────────────────────
+class TokenBucket:
+    """Allows `per_minute` acquisitions per minute with bursts up to `burst`."""
+
+    def __init__(self, per_minute: int, burst: int | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, per_minute // 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_buckets = {p: TokenBucket(rpm) for p, rpm in PROVIDER_RPM.items() if rpm > 0}
+
+def rate_limit(provider: str):
+    """Wait for the provider's rate limit; no-op for unlimited providers."""
+    bucket = _buckets.get(provider)
+    if bucket is not None:
+        bucket.acquire()
+
+# ── Fair Scheduler ─────────────────────────────────────────────────────────────
+class FairScheduler:
+    """Admit work under a global and a per-user concurrency limit.
+
+    Waiting requests are served by lane, then arrival order. A request whose
+    user is already at the per-user limit never holds up other users.
+    """
+
+    def __init__(self, name: str, global_limit: int, per_user_limit: int):
+        self.name = name
+        self.global_limit = max(1, global_limit)
+        self.per_user_limit = max(1, per_user_limit)
+        self._cond = threading.Condition()
+        self._running = 0
+        self._per_user = defaultdict(int)
+        self._waiting = []                 # sorted (lane, seq, user_id) tickets
+        self._seq = itertools.count()
+
+    def _admissible(self, ticket) -> bool:
+        if self._running >= self.global_limit:
+            return False
+        for t in self._waiting:
+            if self._per_user[t[2]] < self.per_user_limit:
+                return t == ticket
+        return False
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {"running": self._running, "queued": len(self._waiting),
+                    "limit": self.global_limit}
+
+    @contextmanager
+    def slot(self, user_id: str, lane: int = LANE_NORMAL, on_wait=None, poll: float = 0.5):
+        """Hold one slot for the duration of the block.
+
+        `on_wait(position)` is called from the waiting thread, roughly every
+        `poll` seconds, with the 1-based queue position while queued.
+        """
+        ticket = (lane, next(self._seq), user_id)
+        with self._cond:
+            self._waiting.append(ticket)
+            self._waiting.sort()
+        try:
+            while True:
+                with self._cond:
+                    if self._admissible(ticket):
+                        self._waiting.remove(ticket)
+                        self._running += 1
+                        self._per_user[user_id] += 1
+                        break
+                    position = self._waiting.index(ticket) + 1
+                if on_wait:
+                    on_wait(position)
+                with self._cond:
+                    self._cond.wait(poll)
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                self._cond.notify_all()
+            raise
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._per_user[user_id] -= 1
+                if not self._per_user[user_id]:
+                    del self._per_user[user_id]
+                self._cond.notify_all()
+
+llm_scheduler = FairScheduler("llm", LLM_MAX_CONCURRENCY, LLM_MAX_PER_USER)
+sql_scheduler = FairScheduler("sql", SQL_MAX_CONCURRENCY, SQL_MAX_PER_USER)
+
+def query_lane(est_rows: int | None) -> int:
+    """Fast lane for queries MySQL expects to be cheap; normal lane otherwise."""
+    return LANE_FAST if est_rows is not None and est_rows <= CHEAP_QUERY_ROWS else LANE_NORMAL
@@ -0,0 +1,155 @@
+import sys
+import json
+import hashlib
+import threading
+import weakref
+from array import array
+from collections.abc import Mapping
+
+# Compact, shared schema representation. A catalog is stored as three flat
+# tuples (table names, column names, column types) plus an offsets array
+# marking where each table's columns start, with every string interned, so
+# names like "id" or types like "int" exist once per process. Objects are
+# immutable and de-duplicated by content fingerprint, so every session that
+# loads the same schema version holds a reference to the same instance.
+# Reads keep the old dict shape: schema[t]["columns"], schema[t]["types"][c].
+
+def canonical_json(obj) -> str:
+    """Key-sorted, compact JSON: byte-stable for equal content."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def fingerprint_of(schema: dict) -> str:
+    """Short content hash identifying one version of a plain-dict schema."""
+    return hashlib.sha256(canonical_json(schema).encode("utf-8")).hexdigest()[:16]
+
+def _text(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    return sys.intern(str(value))
+
+class ColumnTypes(Mapping):
+    """Read-only {column: type} view over one table's slice of a CompactSchema."""
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store, i: int):
+        self._store, self._i = store, i
+
+    def __getitem__(self, column):
+        return self._store._col_types[self._store._positions[self._i][column]]
+
+    def __iter__(self):
+        return iter(self._store._columns(self._i))
+
+    def __len__(self):
+        return len(self._store._positions[self._i])
+
+    def items(self):
+        s, (start, end) = self._store, self._store._span(self._i)
+        return zip(s._col_names[start:end], s._col_types[start:end])
+
+class TableInfo(Mapping):
+    """Read-only {"columns": (...), "types": {...}} record for one table."""
+    __slots__ = ("_store", "_i")
+    KEYS = ("columns", "types")
+
+    def __init__(self, store, i: int):
+        self._store, self._i = store, i
+
+    @property
+    def columns(self) -> tuple:
+        return self._store._columns(self._i)
+
+    @property
+    def types(self) -> ColumnTypes:
+        return ColumnTypes(self._store, self._i)
+
+    def __getitem__(self, key):
+        if key == "columns":
+            return self.columns
+        if key == "types":
+            return self.types
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def to_dict(self) -> dict:
+        return {"columns": list(self.columns), "types": dict(self.types.items())}
+
+class CompactSchema(Mapping):
+    """Immutable {table: TableInfo} mapping backed by flat interned arrays."""
+    __slots__ = ("_tables", "_index", "_offsets", "_col_names", "_col_types", "_positions",
+                 "fingerprint", "__weakref__")
+
+    def __init__(self, schema: Mapping, fingerprint: str | None = None):
+        tables, names, types = [], [], []
+        offsets = array("I", [0])
+        for table, info in schema.items():
+            tables.append(_text(table))
+            col_types = info["types"]
+            for col in info["columns"]:
+                names.append(_text(col))
+                types.append(_text(col_types[col]))
+            offsets.append(len(names))
+        self._tables = tuple(tables)
+        self._index = {t: i for i, t in enumerate(self._tables)}
+        self._offsets = offsets
+        self._col_names = tuple(names)
+        self._col_types = tuple(types)
+        # Per-table {column: flat position} so type lookups don't scan
+        self._positions = tuple({names[j]: j for j in range(offsets[i], offsets[i + 1])}
+                                for i in range(len(tables)))
+        self.fingerprint = fingerprint or fingerprint_of(self.to_dict())
+
+    def _span(self, i: int):
+        return self._offsets[i], self._offsets[i + 1]
+
+    def _columns(self, i: int) -> tuple:
+        start, end = self._span(i)
+        return self._col_names[start:end]
+
+    def __getitem__(self, table):
+        return TableInfo(self, self._index[table])
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, table):
+        return table in self._index
+
+    def column_count(self) -> int:
+        return len(self._col_names)
+
+    def to_dict(self) -> dict:
+        """Plain nested dict, e.g. for JSON serialisation."""
+        return {t: self[t].to_dict() for t in self._tables}
+
+# ── Sharing ────────────────────────────────────────────────────────────────────
+_shared = weakref.WeakValueDictionary()
+_lock = threading.Lock()
+
+def compact_schema(schema: Mapping) -> CompactSchema:
+    """Shared CompactSchema for `schema`; equal content yields the same instance."""
+    if isinstance(schema, CompactSchema):
+        return schema
+    plain = as_plain(schema)
+    fp = fingerprint_of(plain)
+    with _lock:
+        shared = _shared.get(fp)
+        if shared is None:
+            shared = _shared[fp] = CompactSchema(plain, fp)
+        return shared
+
+def as_plain(schema: Mapping) -> dict:
+    """Plain-dict copy of a schema in either representation."""
+    if isinstance(schema, CompactSchema):
+        return schema.to_dict()
+    return {t: {"columns": [_text(c) for c in info["columns"]],
+                "types": {_text(c): _text(info["types"][c]) for c in info["columns"]}}
+            for t, info in schema.items()}
@@ -0,0 +1,95 @@
+import time
+import zlib
+import threading
+from config import SCHEMA_POLL_S
+from sql_helpers import SchemaPreloader, get_db_schema, schema_checksums
+from profiler import invalidate_tables
+
+# Live schema refresh. Every SCHEMA_POLL_S the watcher asks MySQL for one
+# CRC per table (see schema_checksums) and compares it with the same CRC
+# computed from the cached schema, so no baseline snapshot is needed. Only
+# added or changed tables are re-DESCRIBEd; a new CompactSchema (unchanged
+# tables carried over) replaces the preloader's cached one, derived profiles
+# are invalidated, and a version bump tells sessions to pick it up. Prompt
+# caches are keyed by schema fingerprint, so they follow automatically.
+
+def table_checksum(info: dict) -> int:
+    """Python twin of the per-table CRC computed in schema_checksums()."""
+    crc = 0
+    for pos, col in enumerate(info["columns"], start=1):
+        col_type = info["types"][col]
+        if isinstance(col_type, (bytes, bytearray)):
+            col_type = col_type.decode("utf-8")
+        crc ^= zlib.crc32(f"{pos}:{col}:{col_type}".encode("utf-8"))
+    return crc
+
+class SchemaWatcher:
+    """Background poller that keeps a SchemaPreloader's schemas current."""
+
+    def __init__(self, preloader: SchemaPreloader, interval: int = SCHEMA_POLL_S):
+        self.preloader = preloader
+        self.interval = interval
+        self.versions = {}            # db -> int, bumped on every applied change
+        self.changes = {}             # db -> summary of the latest change
+        self._failed = {}             # (db, table) -> checksum that failed to DESCRIBE
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._loop, name="schema-watch", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            for db in list(self.preloader.futures):
+                if not self.preloader.ready(db):
+                    continue
+                try:
+                    self.check(db)
+                except Exception as e:
+                    print(f"⚠️  Schema check for {db} failed: {e}")
+
+    def check(self, db_name: str) -> dict | None:
+        """Apply any schema change in `db_name`; returns the change summary, if any."""
+        schema = self.preloader.get(db_name)
+        remote = schema_checksums(db_name)
+        added = [t for t in remote if t not in schema]
+        removed = [t for t in schema if t not in remote]
+        changed = [t for t in remote if t in schema and table_checksum(schema[t]) != remote[t]]
+        stale = [t for t in added + changed if self._failed.get((db_name, t)) != remote[t]]
+        if not (stale or removed):
+            return None
+
+        fresh = get_db_schema(db_name, stale) if stale else {}
+        for t in stale:
+            if t not in fresh:
+                self._failed[(db_name, t)] = remote[t]
+        if not (fresh or removed):
+            return None
+        updated = {t: fresh.get(t, info) for t, info in schema.items() if t not in removed}
+        updated.update((t, fresh[t]) for t in added if t in fresh)
+        self.preloader.set(db_name, updated)
+        invalidate_tables(db_name, removed + list(fresh))
+
+        summary = {
+            "added": [t for t in added if t in fresh],
+            "changed": [t for t in changed if t in fresh],
+            "removed": removed,
+        }
+        with self._lock:
+            self.versions[db_name] = self.versions.get(db_name, 0) + 1
+            self.changes[db_name] = summary
+        return summary
+
+    def version(self, db_name: str) -> int:
+        with self._lock:
+            return self.versions.get(db_name, 0)
+
+def describe_change(summary: dict) -> str:
+    parts = [f"{label} {', '.join(summary[key])}"
+             for key, label in [("added", "➕"), ("changed", "✏️"), ("removed", "➖")]
+             if summary.get(key)]
+    return " • ".join(parts)
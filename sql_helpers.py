@@ -1,18 +1,13 @@
-import mysql.connector, pandas as pd, time
-from config import MYSQL_HOST, MYSQL_USER, MYSQL_PASS
+import mysql.connector, pandas as pd, time, re
+from concurrent.futures import ThreadPoolExecutor, Future
+from config import SCHEMA_PRELOAD_WORKERS
+from db_routing import PRIMARY, FAILOVER_ERRORS, has_secondaries, plan_targets, mark_down
+from duckdb_accel import try_accelerated
+from schema_store import CompactSchema, compact_schema
 
 # ── Schema ─────────────────────────────────────────────────────────────────────
-def get_db_schema(db_name: str) -> dict:
-    """Return {{table: {columns:list, types:dict}}} for given DB."""
-    cnx = mysql.connector.connect(
-        host=MYSQL_HOST, user=MYSQL_USER,
-        password=MYSQL_PASS, database=db_name
-    )
-    cur = cnx.cursor()
-    cur.execute("SHOW TABLES")
-    tables = [t[0] for t in cur.fetchall()]
+def _describe_tables(cur, tables) -> dict:
     schema = {}
-
     for tbl in tables:
         try:
             cur.execute(f"DESCRIBE `{tbl}`")         # back-ticks fix 1064 error
@@ -24,34 +19,157 @@ def get_db_schema(db_name: str) -> dict:
         except Exception as e:
             print(f"⚠️  DESCRIBE `{tbl}` failed: {e}")
             continue
+    return schema
+
+def get_db_schema(db_name: str, tables=None) -> dict:
+    """Return {{table: {columns:list, types:dict}}} for given DB (optionally only `tables`)."""
+    cnx = PRIMARY.connect(db_name)
+    cur = cnx.cursor()
+    if tables is None:
+        cur.execute("SHOW TABLES")
+        tables = [t[0] for t in cur.fetchall()]
+    schema = _describe_tables(cur, tables)
 
     cur.close(); cnx.close()
     return schema
 
+def load_compact_schema(db_name: str) -> CompactSchema:
+    """Full schema of `db_name` as a shared, interned CompactSchema."""
+    return compact_schema(get_db_schema(db_name))
+
+def schema_checksums(db_name: str) -> dict:
+    """Per-table CRC32 of (position, name, type) of every column, in one cheap query."""
+    cnx = PRIMARY.connect(db_name)
+    cur = cnx.cursor()
+    try:
+        cur.execute(
+            "SELECT TABLE_NAME, BIT_XOR(CRC32(CONCAT_WS(':', ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE))) "
+            "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s GROUP BY TABLE_NAME",
+            (db_name,))
+        return {t: int(crc) for t, crc in cur.fetchall()}
+    finally:
+        cur.close(); cnx.close()
+
+# ── Parallel Schema Preloading ─────────────────────────────────────────────────
+class SchemaPreloader:
+    """Introspect every allowed database on a thread pool so switching is instant.
+
+    Schemas are cached as CompactSchema objects, shared by every session.
+    """
+
+    def __init__(self, db_names, max_workers: int = SCHEMA_PRELOAD_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                        thread_name_prefix="schema-preload")
+        self.futures = {db: self._pool.submit(load_compact_schema, db) for db in db_names}
+
+    def progress(self):
+        """Return (finished, total) across all submitted databases."""
+        return sum(f.done() for f in self.futures.values()), len(self.futures)
+
+    def ready(self, db_name: str) -> bool:
+        fut = self.futures.get(db_name)
+        return fut is not None and fut.done()
+
+    def get(self, db_name: str, timeout=None) -> CompactSchema:
+        """Block until `db_name` is loaded; a previously failed load is retried."""
+        fut = self.futures.get(db_name)
+        if fut is None or (fut.done() and fut.exception() is not None):
+            fut = self.futures[db_name] = self._pool.submit(load_compact_schema, db_name)
+        return fut.result(timeout=timeout)
+
+    def reload(self, db_name: str):
+        """Schedule a fresh introspection of `db_name`, replacing any cached result."""
+        self.futures[db_name] = self._pool.submit(load_compact_schema, db_name)
+
+    def set(self, db_name: str, schema: dict):
+        """Replace the cached schema of `db_name` (used by incremental refresh)."""
+        fut = Future()
+        fut.set_result(compact_schema(schema))
+        self.futures[db_name] = fut
+
+    def errors(self) -> dict:
+        return {db: f.exception() for db, f in self.futures.items()
+                if f.done() and f.exception() is not None}
+
 # ── Query Execution ────────────────────────────────────────────────────────────
-def run_sql_query(sql: str, db_name: str):
-    """Execute query and return (DataFrame, exec_time_s)."""
+def route_query(sql: str, db_name: str, est_rows: int | None = None) -> list:
+    """Ordered execution targets for `sql`, chosen by estimated cost and replica health."""
+    if not has_secondaries():
+        return [PRIMARY]
+    if est_rows is None:
+        try:
+            est_rows = estimate_rows(sql, db_name)
+        except Exception:
+            est_rows = None
+    return plan_targets(est_rows)
+
+def run_sql_query(sql: str, db_name: str, targets=None):
+    """Execute query and return (DataFrame, exec_time_s, target_name).
+
+    `targets` is the failover order from route_query(); it is computed when
+    omitted. Connection-level failures move on to the next target. Queries
+    over snapshotted tables are served from the local DuckDB copy first
+    (target "duckdb"). `target_name` is where the query actually ran.
+    """
     t0 = time.time()
-    cnx = mysql.connector.connect(
-        host=MYSQL_HOST, user=MYSQL_USER,
-        password=MYSQL_PASS, database=db_name
-    )
+    df = try_accelerated(sql, db_name)
+    if df is not None:
+        return df, time.time() - t0, "duckdb"
+    if targets is None:
+        targets = route_query(sql, db_name)
+    for i, target in enumerate(targets):
+        try:
+            cnx = target.connect(db_name)
+            cur = cnx.cursor()
+            try:
+                cur.execute(sql)
+                df = (pd.DataFrame(cur.fetchall(), columns=[c[0] for c in cur.description])
+                      if cur.description else pd.DataFrame())
+            finally:
+                cur.close(); cnx.close()
+            return df, time.time() - t0, target.name
+        except FAILOVER_ERRORS as e:
+            if i == len(targets) - 1:
+                raise
+            print(f"⚠️  {target.name} failed, failing over to {targets[i + 1].name}: {e}")
+            mark_down(target)
+
+def explain_sql(sql: str, db_name: str):
+    """Ask MySQL to plan `sql` without running it. Returns (ok, error_message)."""
+    cnx = PRIMARY.connect(db_name)
     cur = cnx.cursor()
     try:
-        cur.execute(sql)
-        df = (pd.DataFrame(cur.fetchall(), columns=[c[0] for c in cur.description])
-              if cur.description else pd.DataFrame())
+        cur.execute(f"EXPLAIN {sql}")
+        cur.fetchall()
+        return True, "OK"
+    except mysql.connector.Error as e:
+        return False, str(e)
+    finally:
+        cur.close(); cnx.close()
+
+def estimate_rows(sql: str, db_name: str) -> int:
+    """Rough row count MySQL expects to examine (product of EXPLAIN `rows`)."""
+    cnx = PRIMARY.connect(db_name)
+    cur = cnx.cursor(dictionary=True)
+    try:
+        cur.execute(f"EXPLAIN {sql}")
+        estimate = 1
+        for row in cur.fetchall():
+            estimate *= max(1, int(row.get("rows") or 1))
+        return estimate
     finally:
         cur.close(); cnx.close()
-    return df, time.time() - t0
 
 # ── Safety ─────────────────────────────────────────────────────────────────────
+# String literals and quoted identifiers are blanked before keyword checks
+_QUOTED = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`(?:[^`]|``)*`")
+
 def validate_sql(sql: str):
     bad = ["DROP","DELETE","UPDATE","INSERT","ALTER","CREATE","TRUNCATE"]
-    up  = sql.upper()
+    up  = _QUOTED.sub("''", sql).upper()
     if not up.lstrip().startswith("SELECT"):
         return False, "Only SELECT statements are allowed."
     for kw in bad:
-        if kw in up:
+        if re.search(rf"\b{kw}\b", up):        # whole words: created_at, updated_at are fine
             return False, f"Keyword '{kw}' is prohibited."
     return True, "Safe"
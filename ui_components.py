@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
 import math
+from schema_store import as_plain
+
+# Plotly is imported inside the chart/graph views: it is the heaviest import
+# in the app and most reruns never draw a figure.
 
 # ── Enhanced CSS with Interactive Colors ────────────────────────────────────────
 def inject_css():
@@ -140,6 +141,7 @@ def inject_css():
     
     .status-groq { background-color: #22c55e; }
     .status-ollama { background-color: #3b82f6; }
+    .status-local { background-color: #f59e0b; }
     
     @keyframes pulse {
         0% { opacity: 1; }
@@ -173,9 +175,9 @@ def show_provider_selection():
         st.markdown("#### Choose AI Provider")
         provider = st.radio(
             "Select your preferred AI provider:",
-            ["Groq", "Ollama"],
+            ["Groq", "Ollama", "Local"],
             key="ai_provider",
-            help="Groq: Cloud-based, fast inference\nOllama: Local models, privacy-focused"
+            help="Groq: Cloud-based, fast inference\nOllama: Local models, privacy-focused\nLocal: In-process llama.cpp on CPU, fully offline"
         )
     
     with col2:
@@ -189,7 +191,7 @@ def show_provider_selection():
                 help="Different models have varying capabilities and speeds"
             )
             st.markdown('<span class="status-indicator status-groq"></span>Groq Cloud API', unsafe_allow_html=True)
-        else:
+        elif provider == "Ollama":
             from config import OLLAMA_MODELS
             model = st.selectbox(
                 "Choose Ollama model:",
@@ -198,6 +200,15 @@ def show_provider_selection():
                 help="Make sure the selected model is downloaded in Ollama"
             )
             st.markdown('<span class="status-indicator status-ollama"></span>Local Ollama', unsafe_allow_html=True)
+        else:
+            from config import LOCAL_MODELS
+            model = st.selectbox(
+                "Choose GGUF model:",
+                LOCAL_MODELS,
+                key="local_model",
+                help="Quantized GGUF file inside LOCAL_MODEL_DIR"
+            )
+            st.markdown('<span class="status-indicator status-local"></span>In-process llama.cpp', unsafe_allow_html=True)
     
     # Model info display
     with st.expander("ℹ️ Model Information"):
@@ -209,7 +220,7 @@ def show_provider_selection():
                 "mixtral-8x7b-32768": "Mixture of Experts model, great for diverse tasks",
                 "gemma2-9b-it": "Google's Gemma model, optimized for instruction following"
             }
-        else:
+        elif provider == "Ollama":
             model_info = {
                 "llama3.2": "Latest Llama model optimized for local deployment",
                 "llama3.1": "Previous version of Llama, very capable",
@@ -217,11 +228,41 @@ def show_provider_selection():
                 "mistral": "Efficient model with good performance",
                 "gemma2": "Google's open model, good balance of size and capability"
             }
+        else:
+            model_info = {
+                "qwen2.5-coder-1.5b-instruct-q4_k_m.gguf": "Small 4-bit coder model, runs offline on CPU"
+            }
         
         st.write(f"**{model}:** {model_info.get(model, 'Advanced language model')}")
     
     return provider, model
 
+# ── Prompt Prefix-Cache Stats ────────────────────────────────────────────────
+def show_prefix_cache_stats():
+    """Sidebar summary of provider-side prompt prefix reuse"""
+    from llm_helpers import get_prefix_cache_stats
+    stats = get_prefix_cache_stats()
+    if not stats:
+        return
+    with st.expander("⚡ Prompt Cache"):
+        for provider, s in stats.items():
+            hit_rate = s['hits'] / s['requests'] * 100 if s['requests'] else 0
+            cached_pct = s['cached_tokens'] / s['prompt_tokens'] * 100 if s['prompt_tokens'] else 0
+            st.write(f"**{provider}:** {s['hits']}/{s['requests']} hits ({hit_rate:.0f}%)")
+            st.caption(f"{cached_pct:.0f}% of prompt tokens reused • ~{s['saved_s']:.2f}s saved")
+
+def show_repair_stats():
+    """Sidebar summary of automatic SQL repair across all sessions"""
+    from llm_helpers import get_repair_stats
+    stats = get_repair_stats()
+    if not stats['sessions']:
+        return
+    with st.expander("🛠️ SQL Repair"):
+        rate = stats['repaired'] / stats['sessions'] * 100
+        st.write(f"**{stats['repaired']}/{stats['sessions']}** queries repaired ({rate:.0f}%)")
+        st.caption(f"{stats['attempts']} attempts • {stats['failed']} gave up • "
+                   f"{stats['repair_s']:.1f}s spent repairing")
+
 # ── Schema Statistics ─────────────────────────────────────────────────────────
 def show_schema_stats(schema):
     if not schema:
@@ -257,6 +298,7 @@ def show_schema_stats(schema):
 # ── Graphical Schema Viewer ──────────────────────────────────────────────────
 def create_schema_network_graph(schema):
     """Create an interactive network graph using Plotly"""
+    import plotly.graph_objects as go
     if not schema:
         st.info("No schema available to display.")
         return
@@ -393,6 +435,7 @@ def create_schema_network_graph(schema):
 # ── Column Types Analysis ────────────────────────────────────────────────────
 def show_column_types_analysis(schema):
     """Analyze column types across all tables"""
+    import plotly.express as px
     try:
         type_counts = {}
         type_details = []
@@ -473,7 +516,7 @@ def show_column_types_analysis(schema):
     except Exception as e:
         st.error(f"Error analyzing column types: {str(e)}")
         st.info("Raw schema data:")
-        st.json(schema)
+        st.json(as_plain(schema))
 
 # ── Enhanced Schema Viewer ──────────────────────────────────────────────────
 def schema_expander(schema: dict):
@@ -526,12 +569,14 @@ def show_enhanced_history(history):
     
     st.subheader("📜 Query History")
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         st.metric("Total Queries", len(history))
     with col2:
         avg_time = sum(float(h['time'].replace('s', '')) for h in history) / len(history)
         st.metric("Avg Execution Time", f"{avg_time:.3f}s")
+    with col3:
+        st.metric("Auto-Repaired", sum(1 for h in history if h.get('repairs')))
     
     for i, item in enumerate(reversed(history)):
         with st.expander(f"Query {len(history)-i}: {item['nl'][:50]}...", expanded=False):
@@ -545,9 +590,44 @@ def show_enhanced_history(history):
             
             with col2:
                 st.metric("Execution Time", item['time'])
+                if item.get('repairs'):
+                    st.caption(f"🛠️ {item['repairs']} repair attempt(s)")
+
+# ── Background Job Display ──────────────────────────────────────────────────
+JOB_ICONS = {"queued": "⏳", "running": "⚡", "done": "✅", "failed": "❌", "interrupted": "⚠️"}
+
+def show_job_status(job):
+    """One status line (plus SQL/errors) for a background query job"""
+    icon = JOB_ICONS.get(job['status'], "•")
+    if job['status'] in ("queued", "running"):
+        waited = pd.Timestamp.now().timestamp() - job['submitted_at']
+        where = (f"position {job['queue_position']} in queue" if job.get('queue_position')
+                 else "waiting for a worker" if job['status'] == "queued" else "executing")
+        st.info(f"{icon} Job `{job['id']}` {where} • {waited:.0f}s elapsed. "
+                "You can leave this page and come back later.")
+    elif job['status'] == "done":
+        target = f" on **{job['target']}**" if job.get('target') else ""
+        st.success(f"{icon} Job `{job['id']}` finished{target}: {job['rows']} rows in {job['exec_time']:.3f}s")
+        if job.get('repairs'):
+            st.caption(f"🛠️ Auto-repaired in {job['repairs']} attempt(s)")
+    else:
+        st.error(f"{icon} Job `{job['id']}` {job['status']}: {job.get('error', '')}")
+    st.code(job['sql'], language="sql")
+
+def show_job_list(jobs):
+    """Sidebar list of the user's background jobs; returns the id picked to open, if any"""
+    if not jobs:
+        return None
+    picked = None
+    with st.expander(f"🗂️ My Query Jobs ({len(jobs)})"):
+        for job in jobs[:10]:
+            icon = JOB_ICONS.get(job['status'], "•")
+            if st.button(f"{icon} {job['nl'][:40]}", key=f"job_{job['id']}", use_container_width=True):
+                picked = job['id']
+    return picked
 
 # ── Save History ─────────────────────────────────────────────────────────────
-def save_history(nl, sql, db, t, provider, model, result_count=0):
+def save_history(nl, sql, db, t, provider, model, result_count=0, repairs=0):
     st.session_state.history.append({
         "nl": nl, 
         "sql": sql, 
@@ -556,12 +636,104 @@ def save_history(nl, sql, db, t, provider, model, result_count=0):
         "model": model,
         "time": f"{t:.3f}s",
         "result_count": result_count,
+        "repairs": repairs,
         "timestamp": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
     })
     st.session_state.history = st.session_state.history[-20:]
 
+# ── Aggregated Quick Charts ──────────────────────────────────────────────────
+@st.cache_data(ttl=600, max_entries=64, show_spinner="Aggregating in MySQL...")
+def _pushdown_aggregate(kind, sql, db_name, col, bins=None, group_col=None, agg=None,
+                        _user_id="anonymous"):
+    """Full-table aggregates keyed by (sql, db, column, bins/agg), so widget changes don't re-scan.
+    `_user_id` only picks the scheduler queue; it is not part of the cache key."""
+    from chart_helpers import histogram_sql, quantiles_sql, group_agg_sql
+    if kind == "histogram":
+        return histogram_sql(sql, col, db_name, bins, user_id=_user_id)
+    if kind == "quantiles":
+        return quantiles_sql(sql, col, db_name, user_id=_user_id)
+    return group_agg_sql(sql, group_col, col, db_name, agg, user_id=_user_id)
+
+def show_quick_charts(df, sql=None, db_name=None):
+    """Chart pre-aggregated bins/quantiles/groups instead of shipping every row to Plotly"""
+    import plotly.graph_objects as go
+    from chart_helpers import (
+        AGG_FUNCS, histogram_local, quantiles_local, group_agg_local, strip_limit
+    )
+
+    numeric_cols = list(df.select_dtypes(include=['number']).columns)
+    if not numeric_cols:
+        st.info("No numeric columns available for charting.")
+        return
+
+    sources = ["Fetched rows"]
+    if sql and db_name:
+        sources.append("Full table (SQL pushdown)")
+    source = st.radio(
+        "Aggregate over:", sources, horizontal=True,
+        help="Full table pushes the aggregation down to MySQL without the query's LIMIT"
+    )
+    pushdown = source != "Fetched rows"
+    user_id = st.session_state.get("user_id", "anonymous")
+    if pushdown:
+        base = strip_limit(sql)
+        if base != sql.strip().rstrip(";"):
+            st.warning("⚠️ The query's LIMIT is removed: charts cover every matching row, "
+                       "not just the rows returned.")
+        with st.expander("Aggregated query"):
+            st.code(base, language="sql")
+
+    chart_col = st.selectbox("Select column for chart:", numeric_cols)
+    chart_type = st.selectbox("Chart type:", ["Histogram", "Box Plot", "Group By"])
+
+    try:
+        if chart_type == "Histogram":
+            bins = st.slider("Bins:", 5, 100, 30)
+            hist = (_pushdown_aggregate("histogram", sql, db_name, chart_col, bins=bins,
+                                        _user_id=user_id) if pushdown
+                    else histogram_local(df[chart_col], bins))
+            fig = go.Figure(go.Bar(
+                x=(hist['bin_start'] + hist['bin_end']) / 2,
+                y=hist['count'],
+                width=hist['bin_end'] - hist['bin_start'],
+                customdata=hist[['bin_start', 'bin_end']],
+                hovertemplate='%{customdata[0]:.4g} – %{customdata[1]:.4g}<br>Count: %{y}<extra></extra>'
+            ))
+            fig.update_layout(title=f"Distribution of {chart_col}", bargap=0,
+                              xaxis_title=chart_col, yaxis_title="Count")
+            st.plotly_chart(fig, use_container_width=True)
+
+        elif chart_type == "Box Plot":
+            stats = (_pushdown_aggregate("quantiles", sql, db_name, chart_col,
+                                         _user_id=user_id) if pushdown
+                     else quantiles_local(df[chart_col]))
+            if not stats:
+                st.info(f"No non-null values in {chart_col}.")
+                return
+            fig = go.Figure(go.Box(
+                name=chart_col,
+                q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+                lowerfence=[stats['min']], upperfence=[stats['max']]
+            ))
+            fig.update_layout(title=f"Box Plot of {chart_col} ({stats['count']:,} values)")
+            st.plotly_chart(fig, use_container_width=True)
+
+        else:
+            group_col = st.selectbox("Group by:", [c for c in df.columns if c != chart_col] or [chart_col])
+            agg = st.selectbox("Aggregate:", AGG_FUNCS)
+            grouped = (_pushdown_aggregate("group", sql, db_name, chart_col,
+                                           group_col=group_col, agg=agg, _user_id=user_id) if pushdown
+                       else group_agg_local(df, group_col, chart_col, agg))
+            fig = go.Figure(go.Bar(x=grouped[group_col].astype(str), y=grouped['value']))
+            fig.update_layout(title=f"{agg}({chart_col}) by {group_col}",
+                              xaxis_title=group_col, yaxis_title=f"{agg}({chart_col})")
+            st.plotly_chart(fig, use_container_width=True)
+
+    except Exception as e:
+        st.error(f"Error building chart: {str(e)}")
+
 # ── Query Result Display ─────────────────────────────────────────────────────
-def display_query_results(df, execution_time):
+def display_query_results(df, execution_time, sql=None, db_name=None):
     """Enhanced display for query results"""
     if df.empty:
         st.info("📭 No rows returned by the query.")
@@ -595,19 +767,6 @@ def display_query_results(df, execution_time):
         )
     
     elif view_option == "📈 Quick Charts (if applicable)":
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        
-        if len(numeric_cols) > 0:
-            chart_col = st.selectbox("Select column for chart:", numeric_cols)
-            chart_type = st.selectbox("Chart type:", ["Histogram", "Box Plot"])
-            
-            if chart_type == "Histogram":
-                fig = px.histogram(df, x=chart_col, title=f"Distribution of {chart_col}")
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                fig = px.box(df, y=chart_col, title=f"Box Plot of {chart_col}")
-                st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No numeric columns available for charting.")
+        show_quick_charts(df, sql, db_name)
         
         st.dataframe(df, use_container_width=True)
@@ -0,0 +1,55 @@
+import time
+import threading
+from config import DATABASES
+from sql_helpers import SchemaPreloader
+from llm_helpers import warm_up_provider
+from schema_watcher import SchemaWatcher
+
+# Process-wide warm-up: the first session to start kicks off schema
+# preloading (plus the watcher that keeps those schemas live), and each
+# (provider, model) pair is warmed once in the background so the first
+# question doesn't pay for connection setup or model loading. A failed
+# warm-up (Ollama down, model missing) is retried at most every
+# WARM_UP_RETRY_S rather than on every rerun.
+
+WARM_UP_RETRY_S = 300
+
+_preloader = None
+_watcher = None
+_warmed = set()
+_failed = {}                  # (provider, model) -> time of the last failed warm-up
+_lock = threading.Lock()
+
+def schema_preloader() -> SchemaPreloader:
+    """Shared SchemaPreloader, started (with its SchemaWatcher) on first use."""
+    global _preloader, _watcher
+    with _lock:
+        if _preloader is None:
+            _preloader = SchemaPreloader(DATABASES)
+            _watcher = SchemaWatcher(_preloader)
+            _watcher.start()
+        return _preloader
+
+def schema_watcher() -> SchemaWatcher:
+    schema_preloader()
+    return _watcher
+
+def warm_up(provider: str, model: str):
+    """Start schema preloading and warm `provider`/`model` without blocking."""
+    schema_preloader()
+    key = (provider, model)
+    with _lock:
+        if key in _warmed or time.time() - _failed.get(key, 0) < WARM_UP_RETRY_S:
+            return
+        _warmed.add(key)
+
+    def job():
+        try:
+            warm_up_provider(provider, model)
+        except Exception as e:
+            print(f"⚠️  Warm-up of {provider} ({model}) failed, retrying in {WARM_UP_RETRY_S}s: {e}")
+            with _lock:
+                _warmed.discard(key)
+                _failed[key] = time.time()
+
+    threading.Thread(target=job, name="warm-up", daemon=True).start()